@@ -5,27 +5,78 @@ import threading
 import argparse
 import sys
 import re
+import html
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import partial
 from pathlib import Path
 
 import gradio as gr
 import fitz
+from starlette.middleware import Middleware
 
 # 设置项目根目录路径
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 from src.ui.gradio_ui import create_reader_ui
-from src.api.ds_fetch import chat as api_chat, html_convert, translate, client_initialize, recommend, analyze
-from src.document.content_get import text_extract
-from src.document.picture_get import pic_extract, fig_screenshot
-from src.document.content_integrate import html_img_replace
+from src.api.ds_fetch import chat_stream as api_chat_stream, html_convert, translate, client_initialize, cache_initialize, recommend, analyze
+from src.api.ds_fetch import set_html_context, HtmlContext, HTML_CONTEXT_STRATEGIES, HTML_CONTEXT_STRATEGY, HTML_CONTEXT_WINDOW
+from src.api.ds_fetch import set_map_reduce_tokens, MAP_REDUCE_TOKENS
+from src.document.content_get import save_text
+from src.document.scanner import scan_document
+from src.document.image_optimize import optimize_image, DISPLAY_WIDTH
+from src.document.content_integrate import html_img_replace, IMAGE_MODES
+from src.document.page_store import page_cache
+from src.document.asset_store import AssetStore
+from src.job.job_manager import JobManager
+from src.api import llm_retry
+from src.ui.asset_cache import AssetCacheMiddleware
 
-processing_status = {"status": "idle", "message": "请上传PDF并点击处理", "completed_pages": [], "progress": 0}
+IDLE_MESSAGE = "请上传PDF并点击处理"
 
-def setup_environment():
-    """设置环境和创建必要目录"""
+# 任务管理器：每次上传为一个独立任务，工作目录为 temp/jobs/<任务ID>
+job_manager = None
+MAX_CONCURRENT_JOBS = 2  # 同时处理的任务数
+MAX_QUEUED_JOBS = 8  # 排队等待的任务数上限
+
+# 同时进行html转换/翻译的页面数量
+PAGE_WORKERS = 4
+
+# PDF提取进程数，大于1时按页码区间多进程提取（适合图片多的长文档）
+EXTRACT_WORKERS = 1
+
+# LLM回复缓存上限（MB），0表示不使用缓存
+LLM_CACHE_SIZE_MB = 512
+
+# 页面HTML内存缓存上限（MB），所有任务共享
+PAGE_CACHE_SIZE_MB = 64
+
+# 共享图片资源库上限（MB），跨任务复用相同内容的嵌入图片，0表示不使用
+ASSET_STORE_SIZE_MB = 1024
+asset_store = None
+
+# 渐进式渲染：html转换时流式显示生成中的页面，翻译完成后替换为对照版本
+STREAM_RENDER = False
+
+# 图片引用方式：url为任务资源目录下的静态文件（浏览器可缓存），base64为内嵌到页面html
+IMAGE_MODE = "url"
+# 图片压缩：缩小到显示宽度并按内容类型重新编码，0表示不处理；可保留原始全分辨率图片
+IMAGE_WIDTH = DISPLAY_WIDTH
+KEEP_ORIGINAL_IMAGES = False
+# Gradio的文件路由：4.x为/file=，5.x起为/gradio_api/file=
+ASSET_URL_PREFIX = "/file=" if int(gr.__version__.split(".")[0]) < 5 else "/gradio_api/file="
+ASSET_CACHE_MAX_AGE = 365 * 24 * 3600  # 图片缓存时长（秒）
+
+def setup_environment(cache_size_mb=LLM_CACHE_SIZE_MB, max_jobs=MAX_CONCURRENT_JOBS, max_queue=MAX_QUEUED_JOBS,
+                      page_cache_mb=PAGE_CACHE_SIZE_MB, asset_store_mb=ASSET_STORE_SIZE_MB):
+    """设置环境、创建必要目录并启动任务管理器"""
+    global job_manager, asset_store
     
     client_initialize()
+    cache_initialize(max_bytes=int(cache_size_mb * 1024 * 1024))
+    page_cache.max_bytes = int(page_cache_mb * 1024 * 1024)
+    if asset_store_mb > 0:
+        asset_store = AssetStore(project_root / "cache" / "assets", max_bytes=int(asset_store_mb * 1024 * 1024))
 
     temp_dir = project_root / "temp"
     
@@ -36,223 +87,362 @@ def setup_environment():
     # 重新创建目录
     temp_dir.mkdir(exist_ok=True)
     
-    for subdir in ["html/original", "html/translated", "html/final", "picture", "figures"]:
-        (temp_dir / subdir).mkdir(parents=True, exist_ok=True)
+    job_manager = JobManager(
+        process_pdf_background,
+        temp_dir / "jobs",
+        max_concurrent_jobs=max_jobs,
+        max_queued_jobs=max_queue
+    )
     
     return temp_dir
 
-def get_temp_dir():
+def get_temp_dir(job_id=None):
+    """获取任务的工作目录，未指定或任务不存在时返回项目temp目录"""
+    job = job_manager.get(job_id) if job_manager is not None else None
+    if job is not None:
+        return job.dir
     return project_root/"temp"
 
-def load_html(temp_dir):
+def _read_page(entry):
+    """按清单条目读取页面，未变化的页面直接取自内存缓存"""
+    try:
+        return page_cache.read(entry["path"], entry["mtime"], entry["size"])
+    except Exception:
+        return "<p>文件读取失败</p>"
+
+def _page_sources(job):
     """
-    获取可供显示的的html
-    优先级：/final > /original > text_ori.txt
+    按显示规则确定任务每页的内容来源
+    优先级：/final > /original
+    渐进式渲染模式下逐页合并，生成中的预览优先于/original
+
+    Returns:
+        dict: 页码 -> ("file", 清单条目) 或 ("preview", 部分HTML)
     """
-    html_dir = temp_dir / "html" / "final"
-    if html_dir.exists():
-        html_files = sorted(html_dir.glob("*.html"))
-        if html_files:
-            html_contents = []
-            for html_file in html_files:
-                try:
-                    with open(html_file, 'r', encoding='utf-8') as f:
-                        html_contents.append(f.read())
-                except Exception:
-                    html_contents.append("<p>文件读取失败</p>")
-            return html_contents
-    
-    html_dir_ori = temp_dir / "html" / "original"
-    if html_dir_ori.exists():
-        html_files = sorted(html_dir_ori.glob("*.html"))
-        if html_files:
-            html_contents = []
-            for html_file in html_files:
-                try:
-                    with open(html_file, 'r', encoding='utf-8') as f:
-                        html_contents.append(f.read())
-                except Exception:
-                    html_contents.append("<p>文件读取失败</p>")
-            return html_contents
-        
-    text_file = temp_dir / "text_ori.txt"
-    if text_file.exists():
+    pages = job.manifest.snapshot()
+    if not STREAM_RENDER:
+        # 已有最终页面时只显示最终页面
+        stage = "final" if any("final" in stages for stages in pages.values()) else "original"
+        return {page_num: ("file", stages[stage]) for page_num, stages in pages.items() if stage in stages}
+
+    with job.lock:
+        previews = dict(job.previews)
+    sources = {}
+    for page_num in set(pages) | set(previews):
+        stages = pages.get(page_num, {})
+        if "final" in stages:
+            sources[page_num] = ("file", stages["final"])
+        elif page_num in previews:
+            sources[page_num] = ("preview", previews[page_num])
+        else:
+            sources[page_num] = ("file", stages["original"])
+    return sources
+
+def list_pages(job_id=None):
+    """
+    获取任务当前可显示的页面ID列表（页码，升序）
+    尚无页面但已提取出原文时返回[0]，表示原文纯文本页
+    """
+    job = job_manager.get(job_id) if job_manager is not None else None
+    if job is None:
+        return []
+    page_ids = sorted(_page_sources(job))
+    if page_ids:
+        return page_ids
+    if (job.dir / "text_ori.txt").exists():
+        return [0]
+    return []
+
+def get_page_html(job_id, page_id):
+    """
+    获取任务中单个页面的html，未变化的页面直接取自内存缓存
+
+    Args:
+        job_id: 任务ID
+        page_id: list_pages返回的页面ID
+    """
+    job = job_manager.get(job_id) if job_manager is not None else None
+    if job is None:
+        return "<p>未找到可显示的文档内容</p>"
+
+    if page_id == 0:
         try:
-            with open(text_file, 'r', encoding='utf-8') as f:
+            with open(job.dir / "text_ori.txt", 'r', encoding='utf-8') as f:
                 content = f.read()
-                html_content = f"<div style='white-space: pre-wrap; font-family: Arial, sans-serif; line-height: 1.6;'>{content}</div>"
-                return [html_content]
+            return f"<div style='white-space: pre-wrap; font-family: Arial, sans-serif; line-height: 1.6;'>{content}</div>"
         except Exception:
-            pass
-    
-    return ["<p>未找到可显示的文档内容</p>"]
+            return "<p>未找到可显示的文档内容</p>"
+
+    source = _page_sources(job).get(page_id)
+    if source is None:
+        return "<p>页面不存在</p>"
+    kind, value = source
+    if kind == "preview":
+        return value
+    return _read_page(value)
 
-def process_pdf_background(pdf_path):
-    """后台异步处理PDF"""
+def get_page_version(job_id, page_id):
+    """
+    获取页面内容来源的标识，页面内容不变时标识不变（界面据此判断是否需要重新推送页面）
+
+    Returns:
+        tuple: 来源标识，页面不存在时返回None
+    """
+    job = job_manager.get(job_id) if job_manager is not None else None
+    if job is None:
+        return None
+    if page_id == 0:
+        try:
+            stat = os.stat(job.dir / "text_ori.txt")
+        except OSError:
+            return None
+        return ("text", stat.st_mtime_ns, stat.st_size)
+    source = _page_sources(job).get(page_id)
+    if source is None:
+        return None
+    kind, value = source
+    if kind == "preview":
+        return ("preview", len(value), hash(value))
+    return ("file", value["path"], value["mtime"], value["size"])
+
+def run_document_task(func, text, result_file, label):
+    """
+    执行文档级任务（分析/推荐），失败时将错误信息写入结果文件
+
+    Returns:
+        bool: 任务是否成功
+    """
+    try:
+        if func(text):
+            return True
+        message = f"{label}失败"
+    except Exception as e:
+        message = f"{label}失败: {str(e)}"
+    try:
+        with open(result_file, 'w', encoding='utf-8') as f:
+            f.write(message)
+    except Exception:
+        pass
+    return False
+
+def write_fallback_page(temp_dir, page_num, text_page, error):
+    """
+    页面在重试后仍处理失败时生成替代页面，使其余页面照常完成：
+    已完成html转换时使用未翻译的原文页面，否则以纯文本显示该页原文
+
+    Returns:
+        Path: 写入的translated页面路径
+    """
+    original_path = temp_dir / "html" / "original" / f"page_{page_num}.html"
+    translated_path = temp_dir / "html" / "translated" / f"page_{page_num}.html"
+    notice = f'<div class="page-error">第 {page_num} 页处理失败，以下为原文：{html.escape(str(error))}</div>'
+    if original_path.exists():
+        content = original_path.read_text(encoding='utf-8')
+        content, found = re.subn(r'(<body[^>]*>)', lambda m: m.group(1) + notice, content, count=1, flags=re.IGNORECASE)
+        if not found:
+            content = notice + content
+    else:
+        content = (f'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>{notice}'
+                   f'<pre style="white-space: pre-wrap;">{html.escape(text_page)}</pre></body></html>')
+    translated_path.write_text(content, encoding='utf-8')
+    return translated_path
+
+def process_pdf_background(job, page_workers=None):
+    """
+    后台处理一个PDF任务（由任务管理器在工作线程中调用）
+
+    Args:
+        job: 任务对象，PDF位于job.pdf_path，所有输出写入job.dir
+        page_workers: 同时处理的页面数，默认为PAGE_WORKERS
+    """
     
-    global processing_status
+    pdf_path = str(job.pdf_path)
+    temp_dir = job.dir
+    # 本文档独立的html风格上下文
+    job.context = HtmlContext()
     completed_pages = []
+    failed_pages = []  # 处理失败、以替代页面显示的页码
     try:
     
-        # 1. 图片提取
-        processing_status.update({
+        workers = max(1, page_workers or PAGE_WORKERS)
+        # 第一页的html转换完成后再启动其余页面，使后续页面能沿用第一页的风格
+        style_ready = threading.Event()
+
+        def convert_page(page_num, text_page):
+            """html转换 + 翻译，单页流水线（在工作线程中执行）"""
+            on_partial = None
+            if STREAM_RENDER:
+                on_partial = lambda partial_html: job.set_preview(page_num, partial_html)
+            try:
+                html_page = html_convert(text_page, page_num, on_partial=on_partial,
+                                         context=job.context, work_dir=temp_dir)
+                if html_page:
+                    job.manifest.record(page_num, "original", temp_dir / "html" / "original" / f"page_{page_num}.html")
+                    job.notify("pages")
+            finally:
+                if page_num == 1:
+                    style_ready.set()
+                # 转换结束后以清单中的完整页面为准
+                job.pop_preview(page_num)
+            if not html_page:
+                raise RuntimeError(f"处理第 {page_num}页html转换失败")
+
+            translated_html = translate(html_page, page_num, work_dir=temp_dir)
+            if not translated_html:
+                raise RuntimeError(f"翻译第 {page_num}页失败")
+
+        # 1. 单遍扫描：逐页提取文本、图片与figure截图，扫描完的页面立即进入转换流水线
+        job.update_status({
             "status": "processing", 
-            "message": "图片提取中", 
+            "message": "文档扫描中", 
             "completed_pages": completed_pages, 
             "progress": 2.5
         })
-        pic_paths = pic_extract(pdf_path)
-        fig_paths = fig_screenshot(pdf_path)
-        if (not pic_paths) and (fig_paths):
-            processing_status.update({
-                "status": "error", 
-                "message": "图片提取失败", 
-                "completed_pages": completed_pages, 
-                "progress": 2.5
-            })
-            return
-          
-        # 2. 文字提取
-        processing_status.update({
-            "status": "processing", 
-            "message": "文本提取中", 
-            "completed_pages": completed_pages, 
-            "progress": 5
-        })
-        text_pages = text_extract(str(pdf_path))
-        if not text_pages:
-            processing_status.update({
-                "status": "error", 
-                "message": "文本提取失败", 
-                "completed_pages": completed_pages,  
-                "progress": 5
-            })
-            return
-        
-        total_pages = len(text_pages)
-        
-        total_text = "".join(text_pages)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            text_pages = []
+            pic_paths = []
+            fig_paths = []
+            futures = {}
+            waiting_pages = []  # 第一页风格就绪前已扫描、等待提交的页码
 
-        # 3.文章分析生成
-        processing_status.update({
-            "status": "processing", 
-            "message": "论文分析中", 
-            "completed_pages": completed_pages, 
-            "progress": 7.5
-        })
-        analyze_res = analyze(total_text)
-        if not analyze_res:
-            processing_status.update({
-                "status": "error", 
-                "message": "论文分析失败", 
-                "completed_pages": completed_pages,  
-                "progress": 7.5
-            })
-            return
+            def submit_waiting():
+                for waiting_num in waiting_pages:
+                    futures[executor.submit(convert_page, waiting_num, text_pages[waiting_num - 1])] = waiting_num
+                waiting_pages.clear()
 
-        # 4.文章推荐生成
-        processing_status.update({
-            "status": "processing", 
-            "message": "论文推荐中", 
-            "completed_pages": completed_pages, 
-            "progress": 10
-        })
-        recommend_res = recommend(total_text)
-        if not recommend_res:
-            processing_status.update({
-                "status": "error", 
-                "message": "论文推荐失败", 
-                "completed_pages": completed_pages,  
-                "progress": 10
-            })
-            return
-        
-    
-        # 5. 依次处理所有页面
-        temp_dir = get_temp_dir()
-        
-        for i, text_page in enumerate(text_pages):
-            page_num = i+1
-            processing_status.update({
-                "status": "processing", 
-                "message": f"处理第 {page_num}页html转换中", 
-                "completed_pages": completed_pages,
-                "progress": 90*i/total_pages + 10
-            })
-            
-            # 1.HTML转换 
-            html_page = html_convert(text_page, page_num)
-            if not html_page:
-                processing_status.update({
-                    "status": "error", 
-                    "message": f"处理第 {page_num}页html转换失败", 
-                    "completed_pages": completed_pages,
-                    "progress": 90*i/total_pages + 10
+            for record in scan_document(pdf_path, workers=EXTRACT_WORKERS, assets=asset_store):
+                page_num = record["page"]
+                page_pics = record["images"]
+                page_figs = [figure["screenshot_path"] for figure in record["figures"]]
+                if IMAGE_WIDTH > 0:
+                    page_pics = [optimize_image(path, IMAGE_WIDTH, KEEP_ORIGINAL_IMAGES) for path in page_pics]
+                    page_figs = [optimize_image(path, IMAGE_WIDTH, KEEP_ORIGINAL_IMAGES) for path in page_figs]
+                pic_paths.extend(page_pics)
+                fig_paths.extend(page_figs)
+
+                text_pages.append(record["text"])
+                waiting_pages.append(page_num)
+                if page_num == 1 or style_ready.is_set():
+                    submit_waiting()
+                job.update_status({
+                    "status": "processing", 
+                    "message": f"文档扫描中 ({page_num}/{record['page_count']})", 
+                    "completed_pages": completed_pages, 
+                    "progress": 2.5 + 7.5 * page_num / record["page_count"]
                 })
-                return
-            
-            # 2.翻译HTML
-            processing_status.update({
-                "status": "processing", 
-                "message": f"翻译第 {page_num}页中", 
-                "completed_pages": completed_pages,
-                "progress": 90*i/total_pages + 10 + 45/total_pages
-            })
 
-            translated_html = translate(html_page, page_num)
-            if not translated_html:
-                processing_status.update({
+            if (not pic_paths) and (fig_paths):
+                job.update_status({
                     "status": "error", 
-                    "message": f"翻译第 {page_num}页失败", 
-                    "completed_pages": completed_pages,
-                    "progress": 90*i/total_pages + 10 + 45/total_pages
+                    "message": "图片提取失败", 
+                    "completed_pages": completed_pages, 
+                    "progress": 2.5
                 })
                 return
-            
-            translated_file_path = temp_dir / "html" / "translated"/ f"page_{page_num}.html"
-            
-            # 3. 图片嵌入
-            processing_status.update({
-                "status": "processing", 
-                "message": f"整合第 {page_num}页图片中", 
-                "completed_pages": completed_pages,
-                "progress": 90*i/total_pages + 10 + 45/total_pages
-            })
-            final_html = html_img_replace(str(translated_file_path), output_dir=str(temp_dir / "html" / "final"))
-            if not final_html:
-                processing_status.update({
+            if not text_pages:
+                job.update_status({
                     "status": "error", 
-                    "message": f"整合第 {page_num}页图片失败", 
-                    "completed_pages": completed_pages,
-                    "progress": 90*i/total_pages + 10 + 45/total_pages
+                    "message": "文本提取失败", 
+                    "completed_pages": completed_pages,  
+                    "progress": 5
                 })
                 return
+            save_text(pdf_path, text_pages)
+            
+            total_pages = len(text_pages)
             
-            # 页面完成，添加到完成列表
-            completed_pages.append(page_num)
-            processing_status.update({
-                "status": "page_completed", 
-                "message": f"第 {page_num} 页处理完成！({page_num}/{total_pages})", 
+            total_text = "".join(text_pages)
+
+            # 2. 论文分析与推荐：不阻塞页面处理，完成后写入结果文件供界面显示
+            doc_executor = ThreadPoolExecutor(max_workers=2)
+            doc_futures = [
+                doc_executor.submit(run_document_task, partial(analyze, work_dir=temp_dir), total_text, temp_dir / "analyze.txt", "论文分析"),
+                doc_executor.submit(run_document_task, partial(recommend, work_dir=temp_dir), total_text, temp_dir / "recommend.txt", "论文推荐")
+            ]
+            doc_executor.shutdown(wait=False)
+            for future in doc_futures:
+                future.add_done_callback(lambda _: job.notify("results"))
+
+            # 3. 并发处理所有页面
+            job.update_status({
+                "status": "processing", 
+                "message": f"页面处理中（并发数 {workers}）", 
                 "completed_pages": completed_pages,
-                "progress": 90*i/total_pages + 10 + 45/total_pages
+                "progress": 10
             })
+            style_ready.wait()
+            submit_waiting()
+
+            # 已完成转换、等待按页序落盘的页码
+            ready_pages = set()
+            next_page = 1
+            for future in as_completed(futures):
+                page_num = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    # 单页失败（LLM调用已按策略重试）不影响其余页面
+                    print(f"第 {page_num} 页处理失败，使用替代页面: {e}")
+                    write_fallback_page(temp_dir, page_num, text_pages[page_num - 1], str(e) or "未知错误")
+                    failed_pages.append(page_num)
+                ready_pages.add(page_num)
 
-        processing_status.update({
+                # 按页序依次进行图片嵌入，保证final目录与completed_pages连续有序
+                while next_page in ready_pages:
+                    ready_pages.remove(next_page)
+                    translated_file_path = temp_dir / "html" / "translated"/ f"page_{next_page}.html"
+                    final_html = html_img_replace(
+                        str(translated_file_path),
+                        output_dir=str(temp_dir / "html" / "final"),
+                        picture_dir=str(temp_dir / "picture"),
+                        figures_dir=str(temp_dir / "figures"),
+                        image_mode=IMAGE_MODE,
+                        url_prefix=ASSET_URL_PREFIX
+                    )
+                    if not final_html:
+                        job.update_status({
+                            "status": "error", 
+                            "message": f"整合第 {next_page}页图片失败", 
+                            "completed_pages": completed_pages,
+                            "progress": 90*len(completed_pages)/total_pages + 10
+                        })
+                        return
+                    job.manifest.record(next_page, "final", temp_dir / "html" / "final" / f"page_{next_page}.html")
+
+                    # 页面完成，添加到完成列表
+                    completed_pages.append(next_page)
+                    job.update_status({
+                        "status": "page_completed", 
+                        "message": f"第 {next_page} 页处理{'失败，已显示原文' if next_page in failed_pages else '完成'}！({len(completed_pages)}/{total_pages})", 
+                        "completed_pages": completed_pages,
+                        "failed_pages": sorted(failed_pages),
+                        "progress": 90*len(completed_pages)/total_pages + 10
+                    })
+                    next_page += 1
+        finally:
+            # 出错返回时取消尚未开始的页面
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        job.update_status({
             "status": "processing", 
-            "message": "所有页面处理完成，正在最终整理中", 
+            "message": "所有页面处理完成，正在等待论文分析与推荐", 
             "completed_pages": completed_pages,
             "progress": 99
         })
+        # 等待文档级任务结束，保证完成前界面能拿到分析与推荐结果
+        wait(doc_futures)
     
-        processing_status.update({
+        job.update_status({
             "status": "completed", 
-            "message": f"处理完成！共处理 {total_pages} 页", 
+            "message": f"处理完成！共处理 {total_pages} 页" + (f"，第 {'、'.join(map(str, sorted(failed_pages)))} 页处理失败（显示原文）" if failed_pages else ""), 
             "completed_pages": completed_pages,
+            "failed_pages": sorted(failed_pages),
             "progress": 100
         })
         
     except Exception as e:
-        processing_status.update({
+        job.update_status({
             "status": "error", 
             "message": f"PDF处理失败: {str(e)}",
             "completed_pages": completed_pages,
@@ -260,53 +450,34 @@ def process_pdf_background(pdf_path):
         })
     
 def start_pdf_processing(file):
-    """启动PDF处理任务"""
-    global processing_status
-    
+    """
+    创建PDF处理任务并加入队列
+
+    Returns:
+        tuple: (提示信息, 任务ID)，启动失败时任务ID为None
+    """
     if file is None:
         return "错误：未选择任何文件", None
     
     try:
-        # 重置处理状态
-        processing_status.update({
-            "status": "processing", 
-            "message": "开始处理", 
-            "completed_pages": [], 
-            "progress": 0
-        })
-        
-        temp_dir = get_temp_dir()
-        
-        # 清理旧文件
-        for cleanup_dir in ["html", "picture", "figures"]:
-            cleanup_path = temp_dir / cleanup_dir
-            if cleanup_path.exists():
-                shutil.rmtree(cleanup_path)
-        
-        # 重新创建目录
-        for subdir in ["html/original", "html/translated", "html/final", "picture", "figures"]:
-            (temp_dir / subdir).mkdir(parents=True, exist_ok=True)
-
-        # 保存PDF文件
-        pdf_path = temp_dir / "article.pdf"
-        shutil.copy2(file.name, str(pdf_path))
-    
-        # 启动后台处理线程
-        thread = threading.Thread(target=process_pdf_background, args=(str(pdf_path),))
-        thread.daemon = True
-        thread.start()
-        
-        return "处理已开始，请等待..."
+        job = job_manager.submit(file.name)
+        position = job_manager.queue_position(job.id)
+        if position > 0:
+            return f"任务已提交，排队第 {position} 位，请等待...", job.id
+        return "处理已开始，请等待...", job.id
         
     except Exception as e:
-        return f"启动处理失败: {str(e)}"
+        return f"启动处理失败: {str(e)}", None
     
-def check_processing_status():
-    """检查处理状态"""
-    status = processing_status
+def check_processing_status(job_id=None):
+    """检查任务的处理状态"""
+    status = job_manager.get_status(job_id) if job_manager is not None else None
     
-    if status["status"] == "idle":
-        return status["message"], False, 0, []
+    if status is None:
+        return IDLE_MESSAGE, False, 0, []
+    elif status["status"] == "queued":
+        position = job_manager.queue_position(job_id)
+        return f"排队等待处理（第 {position} 位）", False, 0, []
     elif status["status"] == "processing":
         return status["message"], False, status.get("progress", 0), status.get("completed_pages", [])
     elif status["status"] == "page_completed":
@@ -318,7 +489,21 @@ def check_processing_status():
     else:
         return "未知状态", False, 0, []
 
+def wait_for_job_update(job_id, version=0, timeout=30):
+    """
+    阻塞等待任务发生变化（供界面推送进度）
+
+    Returns:
+        tuple: (新版本号, 变化类别集合)，任务不存在时返回 (None, set())
+    """
+    job = job_manager.get(job_id) if job_manager is not None else None
+    if job is None:
+        return None, set()
+    return job.wait_for_update(version, timeout=timeout)
+
 def main():
+    global PAGE_WORKERS, EXTRACT_WORKERS, STREAM_RENDER, IMAGE_MODE, IMAGE_WIDTH, KEEP_ORIGINAL_IMAGES
+
     parser = argparse.ArgumentParser(
         description='论文阅读器',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -337,21 +522,62 @@ def main():
     parser.add_argument('--port', type=int, default=7860, help='Web界面端口号 (默认: 7860)')
     parser.add_argument('--share', action='store_true', help='生成公共链接分享')
     parser.add_argument('--host', default="127.0.0.1", help='服务器主机地址 (默认: 127.0.0.1)')
+    parser.add_argument('--page-workers', type=int, default=PAGE_WORKERS, help=f'同时处理的页面数 (默认: {PAGE_WORKERS})')
+    parser.add_argument('--extract-workers', type=int, default=EXTRACT_WORKERS, help=f'PDF提取进程数，大于1时多进程提取 (默认: {EXTRACT_WORKERS})')
+    parser.add_argument('--html-context', choices=HTML_CONTEXT_STRATEGIES, default=HTML_CONTEXT_STRATEGY,
+                        help=f'html转换风格上下文策略：digest为第一页样式摘要，window为紧邻的前若干页（html转换逐页进行） (默认: {HTML_CONTEXT_STRATEGY})')
+    parser.add_argument('--html-context-window', type=int, default=HTML_CONTEXT_WINDOW, help=f'window策略下附带的历史页数 (默认: {HTML_CONTEXT_WINDOW})')
+    parser.add_argument('--map-reduce-tokens', type=int, default=MAP_REDUCE_TOKENS,
+                        help=f'全文超过该token数时，分析/推荐先并发分段摘要再汇总，0为关闭 (默认: {MAP_REDUCE_TOKENS})')
+    parser.add_argument('--stream-render', action='store_true', help='渐进式渲染：页面生成过程中即显示，翻译完成后替换为对照版本')
+    parser.add_argument('--max-jobs', type=int, default=MAX_CONCURRENT_JOBS, help=f'同时处理的PDF任务数 (默认: {MAX_CONCURRENT_JOBS})')
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUED_JOBS, help=f'排队等待的任务数上限 (默认: {MAX_QUEUED_JOBS})')
+    parser.add_argument('--page-cache-size', type=float, default=PAGE_CACHE_SIZE_MB, help=f'页面HTML内存缓存上限MB (默认: {PAGE_CACHE_SIZE_MB})')
+    parser.add_argument('--asset-store-size', type=float, default=ASSET_STORE_SIZE_MB, help=f'共享图片资源库上限MB，0为关闭 (默认: {ASSET_STORE_SIZE_MB})')
+    parser.add_argument('--image-mode', choices=IMAGE_MODES, default=IMAGE_MODE,
+                        help=f'图片引用方式：url为可缓存的静态文件，base64为内嵌到页面 (默认: {IMAGE_MODE})')
+    parser.add_argument('--image-width', type=int, default=IMAGE_WIDTH, help=f'图片缩小到的显示宽度px，0为不压缩 (默认: {IMAGE_WIDTH})')
+    parser.add_argument('--keep-original-images', action='store_true', help='压缩图片时保留原始全分辨率图片（original子目录）')
+    parser.add_argument('--llm-retries', type=int, default=llm_retry.RETRY_ATTEMPTS, help=f'每次LLM调用最多尝试的次数（指数退避+抖动） (默认: {llm_retry.RETRY_ATTEMPTS})')
+    parser.add_argument('--llm-deadline', type=float, default=llm_retry.CALL_DEADLINE, help=f'每次LLM调用含重试的总时限秒 (默认: {llm_retry.CALL_DEADLINE:g})')
+    parser.add_argument('--llm-timeout', type=float, default=llm_retry.ATTEMPT_TIMEOUT, help=f'单次LLM请求的超时秒 (默认: {llm_retry.ATTEMPT_TIMEOUT:g})')
+    parser.add_argument('--hedge', action='store_true', help='对冲请求：调用耗时超过同类调用的p95时再发出一个相同请求，原请求失败时使用其结果（异步调用取先完成的结果）')
+    parser.add_argument('--cache-size', type=float, default=LLM_CACHE_SIZE_MB, help=f'LLM回复缓存上限MB，0为关闭 (默认: {LLM_CACHE_SIZE_MB})')
     
     args = parser.parse_args()
     
     if args.api_key:
         os.environ['DEEPSEEK_API_KEY'] = args.api_key
+
+    PAGE_WORKERS = max(1, args.page_workers)
+    EXTRACT_WORKERS = max(1, args.extract_workers)
+    set_html_context(args.html_context, args.html_context_window)
+    set_map_reduce_tokens(args.map_reduce_tokens)
+    llm_retry.configure(attempts=args.llm_retries, deadline=args.llm_deadline,
+                        attempt_timeout=args.llm_timeout, hedge=args.hedge)
+    STREAM_RENDER = args.stream_render
+    IMAGE_MODE = args.image_mode
+    IMAGE_WIDTH = max(0, args.image_width)
+    KEEP_ORIGINAL_IMAGES = args.keep_original_images
     
-    setup_environment()
+    setup_environment(
+        cache_size_mb=max(0, args.cache_size),
+        max_jobs=max(1, args.max_jobs),
+        max_queue=max(1, args.max_queue),
+        page_cache_mb=max(0, args.page_cache_size),
+        asset_store_mb=max(0, args.asset_store_size)
+    )
     
     try:
         demo = create_reader_ui(
             get_temp_dir,
-            load_html,
+            list_pages,
+            get_page_html,
+            get_page_version,
             start_pdf_processing,
             check_processing_status,
-            api_chat
+            wait_for_job_update,
+            api_chat_stream
         )
         
         demo.launch(
@@ -361,7 +587,16 @@ def main():
             show_error=True,
             quiet=False,
             inbrowser=True,
-            allowed_paths=[str(project_root)]  # 允许访问项目根目录下的文件
+            # 只允许访问任务目录下的文件（页面图片）；LLM缓存与共享图片资源库不对外提供
+            allowed_paths=[str(project_root / "temp" / "jobs")],
+            blocked_paths=[str(project_root / "cache")],
+            # 任务目录下的图片以长期缓存头返回
+            app_kwargs={"middleware": [Middleware(
+                AssetCacheMiddleware,
+                asset_dir=str(project_root / "temp" / "jobs"),
+                url_prefix=ASSET_URL_PREFIX,
+                max_age=ASSET_CACHE_MAX_AGE
+            )]}
         )
             
     except ImportError:
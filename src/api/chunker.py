@@ -0,0 +1,163 @@
+"""
+长文本分段模块
+
+功能：
+- 按估算的模型token数（而非字符数）分段，使每段贴合模型的实际输入上限
+- 优先在章节、段落边界处断开，段落过长时按句子断开，单句过长时按词断开
+- 支持段与段之间的重叠（上一段末尾若干token的内容重复出现在下一段开头）
+- 每个片段只估算一次token数、分段结果一次拼接，总耗时与文本长度成线性
+"""
+
+import re
+
+DEFAULT_CHUNK_TOKENS = 2000
+DEFAULT_OVERLAP_TOKENS = 0
+
+# 当前段已填充到该比例时，遇到章节标题即断开，让新章节从新的一段开始
+SECTION_BREAK_FILL = 0.5
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+# 段落边界：空行或分页符
+_PARAGRAPH_PATTERN = re.compile(r'\n\s*\n|\f')
+# 没有空行的PDF文本：以句末标点结尾的行视为段落结尾
+_LINE_PARAGRAPH_PATTERN = re.compile(r'(?<=[.!?。！？:：])[ \t]*\n')
+# 句子：以句末标点（英文标点后需有空白）结尾，保留其后的空白以便原样拼接
+_SENTENCE_PATTERN = re.compile(r'.+?(?:[.!?;](?:\s+|\Z)|[。！？；]\s*|\Z)', re.S)
+_WORD_PATTERN = re.compile(r'\S+\s*')
+# 章节标题："1 Introduction"、"2.3. Method"、"IV. RESULTS"、"Abstract" 等
+_SECTION_PATTERN = re.compile(
+    r'^\s*(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z\u4e00-\u9fff]'
+    r'|(?:Abstract|Introduction|Related Work|Conclusions?|References|Acknowledge?ments?|Appendix)\b'
+    r'|第[一二三四五六七八九十\d]+[章节])'
+)
+SECTION_TITLE_MAX_CHARS = 80
+
+
+def estimate_tokens(text):
+    """
+    估算文本的token数（DeepSeek：1个中文字符约0.6 token，1个英文字符约0.3 token）
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def split_paragraphs(text):
+    """
+    将文本切分为段落
+
+    Args:
+        text: 文本；或已按版面分好的段落列表（如PDF文本块），此时原样使用
+
+    Returns:
+        list: 非空段落列表
+    """
+    if not isinstance(text, str):
+        return [p for p in text if p and p.strip()]
+    pattern = _PARAGRAPH_PATTERN if _PARAGRAPH_PATTERN.search(text) else _LINE_PARAGRAPH_PATTERN
+    return [p for p in pattern.split(text) if p.strip()]
+
+
+def is_section_title(paragraph):
+    """段落是否以章节标题开头"""
+    first_line = paragraph.lstrip().split("\n", 1)[0]
+    return len(first_line) <= SECTION_TITLE_MAX_CHARS and bool(_SECTION_PATTERN.match(first_line))
+
+
+def _split_long(text, max_tokens):
+    """将超过上限的段落依次按句子、按词拆成不超过上限的片段"""
+    pieces = []
+    for sentence in _SENTENCE_PATTERN.findall(text):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        for word in _WORD_PATTERN.findall(sentence):
+            if estimate_tokens(word) <= max_tokens:
+                pieces.append(word)
+                continue
+            # 单个“词”仍然过长（如无空格的长串），按中文字符的token数保守地截断
+            step = max(1, int(max_tokens / 0.6) - 2)
+            pieces.extend(word[i:i + step] for i in range(0, len(word), step))
+    return pieces
+
+
+def _units(paragraphs, max_tokens):
+    """
+    生成分段的基本单元
+
+    Yields:
+        tuple: (文本, token数, 是否为段落开头, 是否为章节开头)
+    """
+    for paragraph in paragraphs:
+        section = is_section_title(paragraph)
+        tokens = estimate_tokens(paragraph)
+        if tokens <= max_tokens:
+            yield paragraph, tokens, True, section
+            continue
+        for index, piece in enumerate(_split_long(paragraph, max_tokens)):
+            yield piece, estimate_tokens(piece), index == 0, section and index == 0
+
+
+def _join(units):
+    parts = []
+    for text, _, paragraph_start, _ in units:
+        if parts and paragraph_start:
+            parts.append("\n\n")
+        parts.append(text)
+    return "".join(parts).strip()
+
+
+def chunk_text(text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    按token数将长文本分段
+
+    Args:
+        text: 文本，或按版面分好的段落列表
+        max_tokens: 每段估算token数的上限
+        overlap_tokens: 相邻两段重叠内容的token数上限，0为不重叠
+
+    Returns:
+        list: 分段后的文本列表，段内段落以空行分隔
+    """
+    max_tokens = max(1, int(max_tokens))
+    overlap_tokens = max(0, min(int(overlap_tokens), max_tokens // 2))
+
+    chunks = []
+    current = []  # 当前段的单元
+    current_tokens = 0
+    fresh = 0  # 当前段中不属于重叠部分的单元数
+
+    def flush():
+        nonlocal current, current_tokens, fresh
+        chunks.append(_join(current))
+        # 从末尾取不超过overlap_tokens的单元作为下一段的开头
+        carried, carried_tokens = [], 0
+        for unit in reversed(current):
+            if carried_tokens + unit[1] > overlap_tokens:
+                break
+            carried.append(unit)
+            carried_tokens += unit[1]
+        carried.reverse()
+        # 重叠部分以段落开头，避免与前文拼接
+        if carried:
+            carried[0] = (carried[0][0], carried[0][1], True, False)
+        current, current_tokens, fresh = carried, carried_tokens, 0
+
+    for unit in _units(split_paragraphs(text), max_tokens):
+        _, tokens, paragraph_start, section = unit
+        if fresh:
+            overflow = current_tokens + tokens > max_tokens
+            section_break = section and current_tokens >= max_tokens * SECTION_BREAK_FILL
+            if overflow or section_break:
+                flush()
+                # 重叠部分加上新单元仍然超出时丢弃重叠
+                if current_tokens + tokens > max_tokens:
+                    current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+        fresh += 1
+
+    if fresh:
+        chunks.append(_join(current))
+    return chunks
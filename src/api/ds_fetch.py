@@ -1,9 +1,36 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os, re
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+
+from src.api.llm_cache import LLMCache, make_cache_key, DEFAULT_MAX_BYTES
+from src.api.chunker import chunk_text, estimate_tokens
+from src.api.llm_retry import call_with_retry, acall_with_retry, is_retryable
 
 DEEPSEEK_API_KEY = ''
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+MODEL_NAME = "deepseek-chat"
 
 client = None
+async_client = None  # 异步客户端，所有协程共享
+
+# 异步接口同时在途的最大请求数（每个事件循环各自计数）
+ASYNC_MAX_CONCURRENCY = 32
+_async_semaphores = {}
+
+# 同步代码（线程池）调用异步接口时使用的共享后台事件循环
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+llm_cache = None  # LLM回复的持久化缓存，cache_initialize()后生效
+
+PARTIAL_INTERVAL = 0.5  # 流式生成时回调部分结果的最小间隔（秒）
 
 def get_api_key():
     """
@@ -29,20 +56,320 @@ def get_api_key():
                    "3. 命令行参数: --api-key YOUR_KEY\n"
                    "4. 交互式输入")
 
+
 def client_initialize():
     # 初始化客户端
-    global client
+    global client, async_client
     try:
         DEEPSEEK_API_KEY = get_api_key()
-        client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+        # 重试由llm_retry统一处理（退避、总时限与对冲），关闭SDK自带的重试
+        client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL, max_retries=0)
+        async_client = AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL, max_retries=0)
     except ValueError as e:
         print(f"API密钥配置错误: {e}")
         client = None
+        async_client = None
+
+def cache_initialize(db_path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    初始化LLM回复缓存
+
+    Args:
+        db_path: 缓存数据库路径，默认为项目根目录下 cache/llm_cache.sqlite3
+        max_bytes: 缓存总大小上限（字节），为0时关闭缓存
+    """
+    global llm_cache
+    if not max_bytes:
+        llm_cache = None
+        return
+    if db_path is None:
+        project_root = os.path.join(os.path.dirname(__file__), '..', '..')
+        db_path = os.path.join(os.path.abspath(project_root), "cache", "llm_cache.sqlite3")
+    try:
+        llm_cache = LLMCache(db_path, max_bytes=max_bytes)
+    except Exception as e:
+        print(f"LLM缓存初始化失败，将不使用缓存: {e}")
+        llm_cache = None
+
+def cache_stats():
+    """获取LLM缓存统计信息，未启用缓存时返回None"""
+    return llm_cache.stats() if llm_cache is not None else None
+
+def _get_async_semaphore():
+    """获取当前事件循环的并发信号量（首次使用时创建）"""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    return semaphore
+
+def run_async(coro):
+    """
+    在共享的后台事件循环中运行协程并等待结果（供线程池中的同步代码调用）。
+    所有同步调用方共用一个事件循环，异步客户端的连接池与并发信号量只绑定这一个循环。
+    """
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, name="llm-async-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop).result()
+
+def _completion(messages, temperature, max_tokens=8192, use_cache=True, on_partial=None, kind="completion"):
+    """
+    同步调用对话补全接口，优先读取LLM缓存；失败时按llm_retry的策略重试
+
+    Args:
+        kind: 调用的用途（如"html_convert"、"translate"），llm_retry按用途分别统计耗时
+        on_partial: 可选回调，传入后以流式方式请求，
+            每隔PARTIAL_INTERVAL秒以已生成的全部文本调用一次
+
+    Returns:
+        str: 去除首尾空白的回复内容
+    """
+    if client is None:
+        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
+    cache = llm_cache if use_cache else None
+    if cache is not None:
+        key = make_cache_key(MODEL_NAME, temperature, max_tokens, messages)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    if on_partial is not None:
+        # 流式生成失败时从头重新生成，回调的部分结果随之重新开始；不使用对冲，避免两路结果交替回调
+        answer = call_with_retry(
+            lambda timeout: _stream_with_partial(messages, temperature, max_tokens, on_partial, timeout, kind),
+            key=("stream", kind), hedge=False)
+    else:
+        def request(timeout):
+            response = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            return response.choices[0].message.content.strip()
+        # 耗时按用途分类统计（不同用途的调用输入输出长度差异很大）
+        answer = call_with_retry(request, key=kind)
+    if cache is not None and answer:
+        cache.put(key, answer)
+    return answer
+
+def _stream_with_partial(messages, temperature, max_tokens, on_partial, timeout=None, kind="completion"):
+    """流式生成完整回复，期间按时间间隔回调已生成的文本"""
+    parts = []
+    last_emit = time.monotonic()
+    for delta in _completion_stream(messages, temperature, max_tokens, timeout=timeout, kind=kind):
+        parts.append(delta)
+        now = time.monotonic()
+        if now - last_emit >= PARTIAL_INTERVAL:
+            last_emit = now
+            try:
+                on_partial("".join(parts))
+            except Exception as e:
+                print(f"部分结果回调失败: {e}")
+    return "".join(parts).strip()
 
-# 存储聊天上下文
-CHAT_MESSAGE = []
+def _completion_stream(messages, temperature, max_tokens=8192, timeout=None, kind="completion"):
+    """
+    以流式方式调用对话补全接口（不经过缓存）
+
+    Args:
+        timeout: 本次请求的超时（秒），未指定时建立连接失败按llm_retry的策略重试
+        kind: 调用的用途，见_completion()
+
+    Yields:
+        str: 模型新生成的文本片段
+    """
+    if client is None:
+        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
+    def request(request_timeout):
+        return client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=request_timeout
+        )
+    # 已开始输出后无法透明重试，只对建立请求的过程重试
+    stream = request(timeout) if timeout is not None else call_with_retry(request, key=("stream", kind), hedge=False)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def _acompletion(messages, temperature, max_tokens=8192, use_cache=True, kind="completion"):
+    """
+    异步调用对话补全接口，受ASYNC_MAX_CONCURRENCY限制，优先读取LLM缓存；
+    失败时按llm_retry的策略重试，对冲时落后的请求会被取消
 
-def chat(query, text, target=""):
+    Args:
+        kind: 调用的用途，见_completion()
+
+    Returns:
+        str: 去除首尾空白的回复内容
+    """
+    if async_client is None:
+        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
+    cache = llm_cache if use_cache else None
+    if cache is not None:
+        key = make_cache_key(MODEL_NAME, temperature, max_tokens, messages)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached
+    async def request(timeout):
+        # 每次尝试单独占用并发名额，退避等待期间不占用
+        async with _get_async_semaphore():
+            response = await async_client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+        return response.choices[0].message.content.strip()
+    answer = await acall_with_retry(request, key=kind)
+    if cache is not None and answer:
+        await asyncio.to_thread(cache.put, key, answer)
+    return answer
+
+def _work_path(work_dir, *parts):
+    """获取工作目录下的路径，未指定工作目录时使用项目temp目录"""
+    if work_dir is None:
+        project_root = os.path.join(os.path.dirname(__file__), '..', '..')
+        work_dir = os.path.join(os.path.abspath(project_root), "temp")
+    return os.path.join(str(work_dir), *parts)
+
+def _save_page_html(html_content, subdir, page_num, work_dir=None):
+    """保存单页HTML到<工作目录>/html/<subdir>/page_N.html"""
+    html_filepath = _work_path(work_dir, "html", subdir, f"page_{page_num}.html")
+    with open(html_filepath, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+def _save_result(filename, content, label, work_dir=None):
+    """保存分析/推荐结果到工作目录，失败时仅打印提示"""
+    try:
+        with open(_work_path(work_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+    except Exception as e:
+        print(f"保存{label}结果失败: {e}")
+
+# 聊天历史（不含文档上下文）的token预算，超出后将较早的对话滚动摘要
+CHAT_TOKEN_BUDGET = 3000
+CHAT_KEEP_TURNS = 2  # 摘要时保留原文的最近对话轮数
+CHAT_SESSION_TTL = 7200.0  # 会话闲置超过该秒数后清除
+CHAT_MAX_SESSIONS = 1000  # 最多保留的会话数，超出时清除最久未使用的会话
+
+class ChatSession:
+    """单个用户的聊天会话：较早对话的摘要 + 最近若干轮原文"""
+
+    def __init__(self):
+        self.summary = ""
+        self.turns = []  # [(用户消息, AI回答)]
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.compacting = False  # 是否正在滚动摘要（同一时间只进行一次）
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+# 存储聊天上下文，会话ID -> ChatSession，按最近使用的先后排列
+chat_sessions = OrderedDict()
+chat_sessions_lock = threading.Lock()
+
+def _evict_chat_sessions(now):
+    """清除闲置超过CHAT_SESSION_TTL的会话，并将会话数限制在CHAT_MAX_SESSIONS以内（调用方持有chat_sessions_lock）"""
+    while chat_sessions:
+        session_id, session = next(iter(chat_sessions.items()))
+        if len(chat_sessions) <= CHAT_MAX_SESSIONS and now - session.last_used <= CHAT_SESSION_TTL:
+            break
+        del chat_sessions[session_id]
+
+def get_chat_session(session_id="default"):
+    """获取（不存在时创建）聊天会话，同时清除过期的会话"""
+    now = time.monotonic()
+    with chat_sessions_lock:
+        session = chat_sessions.get(session_id)
+        if session is None:
+            session = chat_sessions[session_id] = ChatSession()
+        else:
+            chat_sessions.move_to_end(session_id)
+        session.last_used = now
+        _evict_chat_sessions(now)
+        return session
+
+def _locked_chat_messages(session, query, text, target=""):
+    """持有会话锁构造聊天请求，避免与正在写入或摘要的历史交错"""
+    with session.lock:
+        return _chat_messages(session, query, text, target)
+
+def _chat_messages(session, query, text, target=""):
+    """
+    构造聊天请求：文档上下文仅在system消息中出现一次，历史对话只包含问答本身
+
+    Returns:
+        tuple: (消息列表, 本轮用户消息)
+    """
+    system_prompt = f"""你是一个善解人意的助教，正在帮助同学理解论文内容。
+    文章内容：{text}
+    请你详细地解答同学的疑问，并引用文章中的相关内容进行说明。"""
+    user_content = f"同学的疑问：{query}"
+    if target:
+        user_content = f"同学特别关注这部分：{target}\n{user_content}"
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if session.summary:
+        messages.append({"role": "system", "content": f"此前对话摘要：{session.summary}"})
+    for history_query, history_answer in session.turns:
+        messages.append({"role": "user", "content": history_query})
+        messages.append({"role": "assistant", "content": history_answer})
+    messages.append({"role": "user", "content": user_content})
+    return messages, user_content
+
+def _chat_summary_messages(summary, turns):
+    """构造滚动摘要请求"""
+    dialogue = "\n".join(f"同学：{q}\n助教：{a}" for q, a in turns)
+    prompt = f"""请将以下助教与同学的对话压缩为简洁的摘要，保留同学关心的问题、已给出的关键结论和术语解释，不超过300字。
+{f'已有摘要：{summary}' if summary else ''}
+新增对话：
+{dialogue}"""
+    return [{"role": "user", "content": prompt}]
+
+def _record_turn(session, user_content, answer):
+    """记录一轮对话，超出预算时滚动摘要"""
+    with session.lock:
+        session.turns.append((user_content, answer))
+    _compact_session(session)
+
+def _compact_session(session):
+    """
+    历史超出token预算时，将较早的对话并入摘要
+    摘要请求期间不持有会话锁，同一会话的其他请求不必等待；期间新增的对话保留在turns中
+    """
+    with session.lock:
+        if (session.compacting or session.history_tokens() <= CHAT_TOKEN_BUDGET
+                or len(session.turns) <= CHAT_KEEP_TURNS):
+            return
+        session.compacting = True
+        summary = session.summary
+        older = session.turns[:-CHAT_KEEP_TURNS]
+    try:
+        summary = _completion(
+            _chat_summary_messages(summary, older), temperature=0.3, max_tokens=600,
+            kind="chat_summary")
+    except Exception as e:
+        # 摘要失败时直接丢弃较早的对话，保证请求大小受控
+        print(f"聊天历史摘要失败: {e}")
+    finally:
+        with session.lock:
+            # 只有_record_turn会修改turns且只在末尾追加，开头的len(older)轮即为已摘要的对话
+            session.summary = summary
+            session.turns = session.turns[len(older):]
+            session.compacting = False
+
+def chat(query, text, target="", session_id="default"):
     '''
     与 AI 聊天并获取回复。
 
@@ -50,45 +377,59 @@ def chat(query, text, target=""):
         query (str): 用户提出的问题或指令。
         text (str): 上下文文本。
         target (str, optional): 目标对象或主题。默认为 ""。
+        session_id (str, optional): 会话ID，不同用户的聊天历史互相独立。
 
     Returns:
         str: AI 的回复。
     '''
 
-    if client is None:
-        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
-    #提示词
-    prompt = f"""你是一个善解人意的助教，正在帮助同学理解论文内容。
-    文章内容：{text}
-    {f'同学特别关注这部分：{target}' if target else ''}
-    同学的疑问：{query}
-    请你详细地解答他的疑问，并引用文章中的相关内容进行说明。"""
-    #更新聊天历史
-    CHAT_MESSAGE.append({"role": "user", "content": prompt})
+    session = get_chat_session(session_id)
+    messages, user_content = _locked_chat_messages(session, query, text, target)
     
-    # 获取回答
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=CHAT_MESSAGE,
-            temperature=0.7,
-            max_tokens=1000  # 增加最大token数以获得更详细的回答
-        )
-    except Exception as e:
-        raise e
+    # 获取回答（max_tokens增加以获得更详细的回答）
+    answer = _completion(messages, temperature=0.7, max_tokens=1000, use_cache=False, kind="chat")
     
     # 更新聊天历史
-    CHAT_MESSAGE.append(response.choices[0].message)
+    _record_turn(session, user_content, answer)
     
     # 返回回答
-    return response.choices[0].message.content.strip()
+    return answer
+
+def chat_stream(query, text, target="", session_id="default"):
+    '''
+    chat() 的流式版本，边生成边返回。
+
+    Yields:
+        str: AI 回复的新增文本片段；生成结束后本轮对话写入会话历史。
+    '''
+    session = get_chat_session(session_id)
+    messages, user_content = _locked_chat_messages(session, query, text, target)
+
+    parts = []
+    for delta in _completion_stream(messages, temperature=0.7, max_tokens=1000, kind="chat"):
+        parts.append(delta)
+        yield delta
+
+    _record_turn(session, user_content, "".join(parts).strip())
+
+async def achat(query, text, target="", session_id="default"):
+    '''
+    chat() 的异步版本，与其共享会话。
+    '''
+    session = get_chat_session(session_id)
+    # 会话锁只在读写历史时短暂持有，可以直接在事件循环中获取
+    messages, user_content = _locked_chat_messages(session, query, text, target)
+    answer = await _acompletion(messages, temperature=0.7, max_tokens=1000, use_cache=False, kind="chat")
+    await asyncio.to_thread(_record_turn, session, user_content, answer)
+    return answer
 
-def chat_reset():
+def chat_reset(session_id="default"):
     '''
     重置聊天历史
     '''
-    CHAT_MESSAGE.clear()
-    return CHAT_MESSAGE
+    with chat_sessions_lock:
+        chat_sessions.pop(session_id, None)
+    return []
 
 
 def clean_html_content(text):
@@ -129,26 +470,180 @@ def clean_html_content(text):
     # 如果都没找到，返回原文本
     return text
 
-html_history = []  # html转换历史，保持风格一致
+def clean_partial_html(text):
+    """
+    清洗生成中的AI输出，得到可直接渲染的部分HTML
 
-def html_convert(page_text, page_num):
-    '''
-    将论文文本内容转换为 HTML 格式并保存为.html文件
-    
     Args:
-        text (str): 要转换的文本内容，字符串，为原论文某页的文本
-    
+        text (str): 尚未生成完毕的模型输出
+
     Returns:
-        str: 该页 HTML 内容
-    
-    Raises:
-        Exception: API 调用失败时抛出异常
-    '''
+        str: 去除代码块标记和前置说明后的HTML片段
+    """
+    if not text:
+        return ""
+    text = re.sub(r'^\s*```(?:html)?\s*', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\s*`{1,3}\s*$', '', text)
+    start = re.search(r'<!DOCTYPE|<html', text, re.IGNORECASE)
+    if start:
+        text = text[start.start():]
+    return text
 
-    if client is None:
-        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
-    
-    prompt = f"""请将以下学术论文内容转换为规范的HTML格式：
+
+# html转换的风格上下文策略，保证每页提示词大小恒定：
+#   "digest" - 仅附带从第一页提取的样式摘要（CSS与class命名）
+#   "window" - 附带第 page_num-N 至 page_num-1 页（N为HTML_CONTEXT_WINDOW）的转换记录，
+#              需等这些页面转换结束才能构造请求，因此多页并发时html转换实际上逐页进行
+HTML_CONTEXT_STRATEGIES = ("digest", "window")
+HTML_CONTEXT_STRATEGY = "digest"
+HTML_CONTEXT_WINDOW = 2
+HTML_CONTEXT_WAIT = 600.0  # window策略下等待前面页面转换结束的最长秒数，超时则只附带已完成的页面
+STYLE_DIGEST_MAX_CHARS = 4000  # 样式摘要中CSS的最大字符数
+
+class HtmlContext:
+    """
+    一篇文档的html转换风格上下文，保证每页提示词大小恒定
+    不同文档（任务）各自持有，互不影响
+    """
+
+    def __init__(self, strategy=None, window=None):
+        self.strategy = strategy or HTML_CONTEXT_STRATEGY
+        if self.strategy not in HTML_CONTEXT_STRATEGIES:
+            raise ValueError(f"不支持的风格上下文策略: {self.strategy}")
+        self.window = max(1, int(window or HTML_CONTEXT_WINDOW))
+        self.history = {}  # html转换历史，页码 -> (提示词, 转换结果)
+        self.settled = {}  # 页码 -> Future，该页转换结束（成功或失败）时完成
+        self.style_digest = None  # 第一页的样式摘要
+        self.lock = threading.Lock()  # 多页并发转换时保护history与settled
+
+    def _window_pages(self, page_num):
+        return range(max(1, page_num - self.window), page_num)
+
+    def _settled_future(self, page_num):
+        future = self.settled.get(page_num)
+        if future is None:
+            future = self.settled[page_num] = Future()
+        return future
+
+    def _pending(self, page_num):
+        """window策略下本页需要等待的前面页面"""
+        if self.strategy != "window":
+            return []
+        with self.lock:
+            return [self._settled_future(p) for p in self._window_pages(page_num)]
+
+    def _build(self, prompt, page_num):
+        messages = []
+        with self.lock:
+            if self.strategy == "digest":
+                if self.style_digest:
+                    messages.append({"role": "system", "content": self.style_digest})
+            else:
+                # 只使用紧邻的前N页，结果与各页完成的先后顺序无关
+                for p in self._window_pages(page_num):
+                    if p in self.history:
+                        history_prompt, history_answer = self.history[p]
+                        messages.append({"role": "user", "content": history_prompt})
+                        messages.append({"role": "assistant", "content": history_answer})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def messages(self, prompt, page_num):
+        """按风格上下文策略构造本页请求的消息列表（长度有上限），window策略下先等待前N页转换结束"""
+        pending = self._pending(page_num)
+        if pending:
+            wait(pending, timeout=HTML_CONTEXT_WAIT)
+        return self._build(prompt, page_num)
+
+    async def amessages(self, prompt, page_num):
+        """messages() 的异步版本，等待期间不阻塞事件循环"""
+        pending = self._pending(page_num)
+        if pending:
+            await asyncio.wait([asyncio.wrap_future(f) for f in pending], timeout=HTML_CONTEXT_WAIT)
+        return self._build(prompt, page_num)
+
+    def _settle(self, page_num):
+        future = self._settled_future(page_num)
+        if not future.done():
+            future.set_result(None)
+
+    def record(self, prompt, answer, page_num):
+        """记录本页的转换结果，供后续页面保持风格"""
+        with self.lock:
+            if self.style_digest is None:
+                self.style_digest = extract_style_digest(answer)
+            if self.strategy == "window":
+                self.history[page_num] = (prompt, answer)
+            self._settle(page_num)
+
+    def skip(self, page_num):
+        """本页转换失败：后续页面不再等待它，也不附带它的记录"""
+        with self.lock:
+            self._settle(page_num)
+
+    def reset(self):
+        """清空转换历史与样式摘要"""
+        with self.lock:
+            for future in self.settled.values():
+                if not future.done():
+                    future.set_result(None)
+            self.settled.clear()
+            self.history.clear()
+            self.style_digest = None
+
+html_context = HtmlContext()  # 未指定上下文时使用的默认上下文
+
+def set_html_context(strategy=None, window=None):
+    """
+    设置html转换的默认风格上下文策略（对之后新建的HtmlContext生效）
+
+    Args:
+        strategy: "digest" 或 "window"
+        window: "window" 策略下附带的历史页数
+    """
+    global HTML_CONTEXT_STRATEGY, HTML_CONTEXT_WINDOW, html_context
+    if strategy is not None:
+        if strategy not in HTML_CONTEXT_STRATEGIES:
+            raise ValueError(f"不支持的风格上下文策略: {strategy}")
+        HTML_CONTEXT_STRATEGY = strategy
+    if window is not None:
+        HTML_CONTEXT_WINDOW = max(1, int(window))
+    html_context = HtmlContext()
+
+def html_context_reset():
+    """清空默认上下文的html转换历史与样式摘要（处理新文档前调用）"""
+    html_context.reset()
+
+def extract_style_digest(html_content, max_chars=STYLE_DIGEST_MAX_CHARS):
+    """
+    从已转换的HTML中提取紧凑的样式摘要
+
+    Returns:
+        str: 包含CSS与常用class名的摘要文本，无样式信息时返回空字符串
+    """
+    styles = re.findall(r'<style[^>]*>(.*?)</style>', html_content, re.DOTALL | re.IGNORECASE)
+    css = "\n".join(styles)
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css).strip()[:max_chars]
+
+    class_names = []
+    for attr in re.findall(r'class="([^"]*)"', html_content, re.IGNORECASE):
+        for name in attr.split():
+            if name not in class_names:
+                class_names.append(name)
+
+    if not css and not class_names:
+        return ""
+    digest = "以下是本文档第一页使用的样式，请沿用相同的CSS与class命名，保持各页视觉一致：\n"
+    if css:
+        digest += f"<style>{css}</style>\n"
+    if class_names:
+        digest += f"常用class：{', '.join(class_names)}"
+    return digest
+
+def _html_convert_prompt(page_text):
+    """构造html转换提示词"""
+    return f"""请将以下学术论文内容转换为规范的HTML格式：
 
 【转换要求】
 1. 输出格式：生成完整HTML文档，包含<!DOCTYPE html>声明、<head>和<body>标签
@@ -170,60 +665,74 @@ def html_convert(page_text, page_num):
 
 【待转换的论文内容】
 {page_text} """
+
+def html_convert(page_text, page_num, on_partial=None, context=None, work_dir=None):
+    '''
+    将论文文本内容转换为 HTML 格式并保存为.html文件
     
-    # 获取html文件夹
-    project_root = os.path.join(os.path.dirname(__file__), '..', '..')
-    current_dir = os.path.abspath(project_root)
-    html_dir = os.path.join(current_dir, "temp", "html", "original")
+    Args:
+        text (str): 要转换的文本内容，字符串，为原论文某页的文本
+        on_partial (callable, optional): 传入后流式生成，并定期以清洗后的部分HTML调用
+        context (HtmlContext, optional): 风格上下文，默认为模块级html_context
+        work_dir (str, optional): 工作目录，结果保存到<work_dir>/html/original，默认为temp
+    
+    Returns:
+        str: 该页 HTML 内容
+    
+    Raises:
+        Exception: API 调用失败时抛出异常
+    '''
+
+    if client is None:
+        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
+    
+    prompt = _html_convert_prompt(page_text)
+    context = context or html_context
 
     # 处理文件
     try:
-        html_history.append({"role": "user", "content": prompt})
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=html_history,
-            temperature=0.2,  
-            max_tokens=8192
-            )
-        html_history.append(response.choices[0].message)
-        html_content = response.choices[0].message.content.strip()
+        partial_callback = None
+        if on_partial is not None:
+            partial_callback = lambda text: on_partial(clean_partial_html(text))
+        answer = _completion(context.messages(prompt, page_num), temperature=0.2,
+                             on_partial=partial_callback, kind="html_convert")
+        context.record(prompt, answer, page_num)
         # 清洗输出，获得纯html
-        html_content = clean_html_content(html_content)
+        html_content = clean_html_content(answer)
         # 保存HTML文件
-        html_filename = f"page_{page_num}.html"
-        html_filepath = os.path.join(html_dir, html_filename)
-        with open(html_filepath, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        _save_page_html(html_content, "original", page_num, work_dir)
     except Exception as e:
-                error_msg = f"第{page_num}页转换失败: {str(e)}"
-                print(error_msg)
+        context.skip(page_num)
+        error_msg = f"第{page_num}页转换失败: {str(e)}"
+        print(error_msg)
+        raise RuntimeError(error_msg) from e
     
     return html_content
 
-
-def translate(page_text, page_num):
+async def ahtml_convert(page_text, page_num, context=None, work_dir=None):
     '''
-    将 PDF 文本内容翻译成中文，并且保存为html文件
-    
-    Args:
-        text_part (str): 要翻译的文本内容(html)
-    
-    Returns:
-        str: 翻译后的 HTML 格式中文内容
-    
+    html_convert() 的异步版本，与其共享html转换历史。
+
     Raises:
         Exception: API 调用失败时抛出异常
     '''
+    prompt = _html_convert_prompt(page_text)
+    context = context or html_context
+    try:
+        answer = await _acompletion(await context.amessages(prompt, page_num), temperature=0.2,
+                                    kind="html_convert")
+    except BaseException:
+        context.skip(page_num)
+        raise
+    context.record(prompt, answer, page_num)
+    html_content = clean_html_content(answer)
+    _save_page_html(html_content, "original", page_num, work_dir)
+    return html_content
 
-     # 获取html文件夹
-    project_root = os.path.join(os.path.dirname(__file__), '..', '..')
-    current_dir = os.path.abspath(project_root)
-    html_dir = os.path.join(current_dir, "temp", "html", "translated")
 
-    if client is None:
-        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
-    
-    prompt = f"""请将以下英文论文内容翻译成中文：
+def _translate_prompt(page_text):
+    """构造翻译提示词"""
+    return f"""请将以下英文论文内容翻译成中文：
 
 {page_text}
 
@@ -240,44 +749,209 @@ def translate(page_text, page_num):
 
 请确保输出的内容可以直接保存为.html文件。"""
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=8192
-        )
-        html_content = response.choices[0].message.content.strip()
-        # 清洗输出，获得纯html
-        html_content = clean_html_content(html_content)
-        # 保存HTML文件
-        html_filename = f"page_{page_num}.html"
-        html_filepath = os.path.join(html_dir, html_filename)
-        with open(html_filepath, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        return html_content
-    except Exception as e:
-        raise e
-
-
-def recommend(text):
+def translate(page_text, page_num, work_dir=None):
     '''
-    基于 PDF 内容生成推荐建议
+    将 PDF 文本内容翻译成中文，并且保存为html文件
     
     Args:
-        text (str): 要分析的文本内容
+        text_part (str): 要翻译的文本内容(html)
+        work_dir (str, optional): 工作目录，结果保存到<work_dir>/html/translated，默认为temp
     
     Returns:
-        str: 基于内容的推荐建议
+        str: 翻译后的 HTML 格式中文内容
     
     Raises:
         Exception: API 调用失败时抛出异常
     '''
 
-    if client is None:
-        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
-    
-    prompt = f"""基于以下论文内容，为读者推荐相关论文：
+    html_content = _translate_html(page_text)
+    # 保存HTML文件
+    _save_page_html(html_content, "translated", page_num, work_dir)
+    return html_content
+
+def _translate_html(page_text):
+    """翻译并清洗输出，获得纯html（不保存）"""
+    messages = [{"role": "user", "content": _translate_prompt(page_text)}]
+    return clean_html_content(_completion(messages, temperature=0.1, kind="translate"))
+
+async def atranslate(page_text, page_num, work_dir=None):
+    '''
+    translate() 的异步版本
+    '''
+    messages = [{"role": "user", "content": _translate_prompt(page_text)}]
+    html_content = clean_html_content(await _acompletion(messages, temperature=0.1, kind="translate"))
+    _save_page_html(html_content, "translated", page_num, work_dir)
+    return html_content
+
+
+# 长文档的map-reduce：全文超过MAP_REDUCE_TOKENS时，先并发地分段摘要（map），
+# 再以按顺序拼接的各段摘要代替全文进行分析/推荐（reduce）；0表示始终使用全文
+MAP_REDUCE_TOKENS = 24000
+SUMMARY_CHUNK_TOKENS = 6000
+SUMMARY_OVERLAP_TOKENS = 200
+SUMMARY_MAX_TOKENS = 1024
+SUMMARY_FILE = "summaries.json"
+SUMMARIZED_NOTE = "（以下为论文按顺序分段整理的摘要）"
+
+# 同一文档正在进行的分段摘要：(结果文件路径, 全文哈希) -> Future，并发的调用方共享一次计算
+_summary_futures = {}
+_summary_futures_lock = threading.Lock()
+
+def set_map_reduce_tokens(tokens):
+    """设置启用map-reduce的全文token数阈值，0为关闭"""
+    global MAP_REDUCE_TOKENS
+    MAP_REDUCE_TOKENS = max(0, int(tokens))
+
+def _summary_prompt(chunk, index, total):
+    """构造分段摘要提示词"""
+    return f"""以下是一篇论文的第 {index}/{total} 部分：
+
+{chunk}
+
+请为这一部分写一份详细摘要：
+1. 保留本部分的研究问题、方法细节、实验设置与关键数据
+2. 保留出现的术语、模型/数据集名称与引用的重要工作
+3. 不要推测本部分之外的内容
+4. 以纯文本形式分条列出"""
+
+async def asummarize_chunks(chunks):
+    '''
+    并发地为各段生成摘要（map阶段），受ASYNC_MAX_CONCURRENCY限制
+
+    Returns:
+        list: 与chunks一一对应的摘要
+    '''
+    total = len(chunks)
+    return await asyncio.gather(*(
+        _acompletion([{"role": "user", "content": _summary_prompt(chunk, index, total)}],
+                     temperature=0.2, max_tokens=SUMMARY_MAX_TOKENS, kind="summary")
+        for index, chunk in enumerate(chunks, 1)
+    ))
+
+def _text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_summaries(work_dir=None, text=None):
+    '''
+    读取已保存的分段摘要
+
+    Args:
+        text (str, optional): 传入时只返回与该全文一致的摘要
+
+    Returns:
+        list: [{"chunk": 原文分段, "summary": 摘要}]，不存在时返回None
+    '''
+    try:
+        with open(_work_path(work_dir, SUMMARY_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if text is not None and data.get("digest") != _text_digest(text):
+        return None
+    return data.get("chunks")
+
+def _claim_summary(text, work_dir):
+    """
+    登记同一文档的分段摘要计算
+
+    Returns:
+        tuple: (key, Future, 是否由调用方负责计算)
+    """
+    key = (os.path.abspath(_work_path(work_dir, SUMMARY_FILE)), _text_digest(text))
+    with _summary_futures_lock:
+        future = _summary_futures.get(key)
+        owner = future is None
+        if owner:
+            future = _summary_futures[key] = Future()
+    return key, future, owner
+
+def _release_summary(key):
+    with _summary_futures_lock:
+        _summary_futures.pop(key, None)
+
+def _split_for_summary(text):
+    chunks = chunk_text(text, SUMMARY_CHUNK_TOKENS, SUMMARY_OVERLAP_TOKENS)
+    print(f"文档较长，分为 {len(chunks)} 段并发摘要...")
+    return chunks
+
+def _save_summaries(text, chunks, summaries, work_dir):
+    """保存分段摘要到<work_dir>/summaries.json"""
+    result = [{"chunk": chunk, "summary": summary} for chunk, summary in zip(chunks, summaries)]
+    _save_result(SUMMARY_FILE, json.dumps({"digest": _text_digest(text), "chunks": result}, ensure_ascii=False),
+                 "分段摘要", work_dir)
+    return result
+
+def summarize_document(text, work_dir=None):
+    '''
+    将长文档分段并生成各段摘要，结果保存到<work_dir>/summaries.json供其他功能复用。
+    同一文档的并发调用（如同时进行的分析与推荐，包括异步版本）只计算一次。
+
+    Returns:
+        list: [{"chunk": 原文分段, "summary": 摘要}]
+    '''
+    key, future, owner = _claim_summary(text, work_dir)
+    if not owner:
+        return future.result()
+
+    try:
+        result = load_summaries(work_dir, text)
+        if result is None:
+            chunks = _split_for_summary(text)
+            result = _save_summaries(text, chunks, run_async(asummarize_chunks(chunks)), work_dir)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _release_summary(key)
+
+async def asummarize_document(text, work_dir=None):
+    '''
+    summarize_document() 的异步版本（在调用方的事件循环中摘要），与其共享同一次计算
+    '''
+    key, future, owner = _claim_summary(text, work_dir)
+    if not owner:
+        return await asyncio.wrap_future(future)
+
+    try:
+        result = load_summaries(work_dir, text)
+        if result is None:
+            chunks = _split_for_summary(text)
+            result = _save_summaries(text, chunks, await asummarize_chunks(chunks), work_dir)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _release_summary(key)
+
+def _join_summaries(summaries):
+    return "\n\n".join(f"[第 {i} 部分摘要]\n{summary}" for i, summary in enumerate(summaries, 1))
+
+def _reduce_source(text, work_dir=None):
+    """
+    分析/推荐的输入：较短的文档为全文，超过MAP_REDUCE_TOKENS时为各段摘要（reduce阶段）
+
+    Returns:
+        tuple: (输入文本, 是否为摘要)
+    """
+    if not MAP_REDUCE_TOKENS or estimate_tokens(text) <= MAP_REDUCE_TOKENS:
+        return text, False
+    return _join_summaries(item["summary"] for item in summarize_document(text, work_dir)), True
+
+async def _areduce_source(text, work_dir=None):
+    """_reduce_source() 的异步版本（在调用方的事件循环中摘要）"""
+    if not MAP_REDUCE_TOKENS or estimate_tokens(text) <= MAP_REDUCE_TOKENS:
+        return text, False
+    summaries = await asummarize_document(text, work_dir)
+    return _join_summaries(item["summary"] for item in summaries), True
+
+
+def _recommend_prompt(text, summarized=False):
+    """构造推荐提示词"""
+    return f"""基于以下论文内容，为读者推荐相关论文{SUMMARIZED_NOTE if summarized else ""}：
 
 {text}
 
@@ -291,47 +965,43 @@ def recommend(text):
 
 请不要包含其他解释内容。"""
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=8192
-        )
-        recommend_res = response.choices[0].message.content.strip()
-        # 保存推荐结果
-        project_root = os.path.join(os.path.dirname(__file__), '..', '..')
-        current_dir = os.path.abspath(project_root)
-        temp_dir = os.path.join(current_dir, "temp")
-        recommend_file = os.path.join(temp_dir, "recommend.txt")
-        try:
-            with open(recommend_file, 'w', encoding='utf-8') as f:
-                f.write(recommend_res)
-        except Exception as e:
-            print(f"保存推荐结果失败: {e}")
-        return recommend_res
-    except Exception as e:
-        raise e
-
-
-def analyze(text):
+def recommend(text, work_dir=None):
     '''
-    对 PDF 文本内容进行深度分析
+    基于 PDF 内容生成推荐建议
     
     Args:
         text (str): 要分析的文本内容
+        work_dir (str, optional): 工作目录，结果保存到<work_dir>/recommend.txt，默认为temp
     
     Returns:
-        str: 文本内容的详细分析结果
+        str: 基于内容的推荐建议
     
     Raises:
         Exception: API 调用失败时抛出异常
     '''
 
-    if client is None:
-        raise RuntimeError("API客户端未初始化，请检查API密钥配置")
-    
-    prompt = f"""请对以下论文进行深度分析：
+    # 长文档先分段摘要，再基于各段摘要生成
+    source, summarized = _reduce_source(text, work_dir)
+    messages = [{"role": "user", "content": _recommend_prompt(source, summarized)}]
+    recommend_res = _completion(messages, temperature=0.5, kind="recommend")
+    # 保存推荐结果
+    _save_result("recommend.txt", recommend_res, "推荐", work_dir)
+    return recommend_res
+
+async def arecommend(text, work_dir=None):
+    '''
+    recommend() 的异步版本
+    '''
+    source, summarized = await _areduce_source(text, work_dir)
+    messages = [{"role": "user", "content": _recommend_prompt(source, summarized)}]
+    recommend_res = await _acompletion(messages, temperature=0.5, kind="recommend")
+    _save_result("recommend.txt", recommend_res, "推荐", work_dir)
+    return recommend_res
+
+
+def _analyze_prompt(text, summarized=False):
+    """构造分析提示词"""
+    return f"""请对以下论文进行深度分析{SUMMARIZED_NOTE if summarized else ""}：
 
 {text}
 
@@ -346,106 +1016,174 @@ def analyze(text):
 
 请提供专业分析。"""
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4,
-            max_tokens=8192
-        )
-        
-        analyze_res = response.choices[0].message.content.strip()
-        
-        # 保存分析结果
-        project_root = os.path.join(os.path.dirname(__file__), '..', '..')
-        current_dir = os.path.abspath(project_root)
-        temp_dir = os.path.join(current_dir, "temp")
-        analyze_file = os.path.join(temp_dir, "analyze.txt")
-        try:
-            with open(analyze_file, 'w', encoding='utf-8') as f:
-                f.write(analyze_res)
-        except Exception as e:
-            print(f"保存分析结果失败: {e}")
+def analyze(text, work_dir=None):
+    '''
+    对 PDF 文本内容进行深度分析
     
-        return analyze_res
-    except Exception as e:
-        raise e
+    Args:
+        text (str): 要分析的文本内容
+        work_dir (str, optional): 工作目录，结果保存到<work_dir>/analyze.txt，默认为temp
+    
+    Returns:
+        str: 文本内容的详细分析结果
+    
+    Raises:
+        Exception: API 调用失败时抛出异常
+    '''
 
+    # 长文档先分段摘要，再基于各段摘要生成
+    source, summarized = _reduce_source(text, work_dir)
+    messages = [{"role": "user", "content": _analyze_prompt(source, summarized)}]
+    analyze_res = _completion(messages, temperature=0.4, kind="analyze")
+    # 保存分析结果
+    _save_result("analyze.txt", analyze_res, "分析", work_dir)
+    return analyze_res
 
+async def aanalyze(text, work_dir=None):
+    '''
+    analyze() 的异步版本
+    '''
+    source, summarized = await _areduce_source(text, work_dir)
+    messages = [{"role": "user", "content": _analyze_prompt(source, summarized)}]
+    analyze_res = await _acompletion(messages, temperature=0.4, kind="analyze")
+    _save_result("analyze.txt", analyze_res, "分析", work_dir)
+    return analyze_res
 
 
 
-def split_text(text, max_length=3000):
-    '''
-    将长文本分割成较小的段落，用于分批处理
 
-    Args:
-        text (str): 要分割的文本
-        max_length (int): 每段的最大长度
 
-    Returns:
-        list: 分割后的文本段落列表
-    '''
-    chunks = []
-    sentences = text.split('. ')
-    current_chunk = ""
-    
-    for sentence in sentences:
-        if len(current_chunk + sentence + '. ') <= max_length:
-            current_chunk += sentence + '. '
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence + '. '
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+# 长文本翻译分段的token上限：输出包含原文与译文的HTML（约为输入的3倍），受单次输出上限8192约束
+TRANSLATE_CHUNK_TOKENS = 2000
+# 长文本分段处理：同时处理的段数，以及失败段的重试轮数（每轮只重试仍失败的段）
+FETCH_LONG_WORKERS = 4
+FETCH_LONG_RETRIES = 2
+
+class ChunkResult:
+    """长文本处理中单段的执行结果"""
+
+    def __init__(self, index, chunk):
+        self.index = index  # 段序号（从1开始）
+        self.chunk = chunk
+        self.status = "pending"  # pending / ok / failed
+        self.result = None
+        self.error = None
+        self.retryable = True  # 失败原因是否值得重试
+        self.attempts = 0
+        self.latency = 0.0  # 最后一次尝试的耗时（秒）
+
+    def to_dict(self):
+        return {"index": self.index, "status": self.status, "attempts": self.attempts,
+                "latency": round(self.latency, 3), "error": self.error}
+
+class LongFetchResult:
+    """长文本处理的整体结果：按段序排列的各段结果"""
 
-def pdf_fetch_long(text, demand="translate", chunk_size=3000):
+    def __init__(self, demand, chunks):
+        self.demand = demand
+        self.chunks = [ChunkResult(index, chunk) for index, chunk in enumerate(chunks, 1)]
+        self.elapsed = 0.0  # 总耗时（秒）
+
+    @property
+    def ok(self):
+        return all(item.status == "ok" for item in self.chunks)
+
+    @property
+    def failed(self):
+        return [item for item in self.chunks if item.status != "ok"]
+
+    @property
+    def text(self):
+        """按段序合并的成功结果"""
+        return "\n\n".join(item.result for item in self.chunks if item.status == "ok")
+
+    def summary(self):
+        return {"demand": self.demand, "ok": self.ok, "elapsed": round(self.elapsed, 3),
+                "chunks": [item.to_dict() for item in self.chunks]}
+
+def _run_chunk(func, item):
+    """执行一段并记录状态与耗时，不抛出异常"""
+    item.attempts += 1
+    start = time.monotonic()
+    try:
+        item.result = func(item)
+        item.status, item.error = "ok", None
+    except Exception as e:
+        item.status, item.error = "failed", str(e)
+        # 与llm_retry相同的判断：只有暂时性的错误值得整段重试；鉴权/参数错误、已超出总时限、
+        # 本地文件读写等确定性的错误重试也不会成功
+        item.retryable = is_retryable(e)
+    item.latency = time.monotonic() - start
+    return item
+
+def pdf_fetch_long(text, demand="translate", chunk_tokens=None, overlap_tokens=0, work_dir=None,
+                   max_workers=None, retries=None, detailed=False):
     '''
     处理长篇内容的翻译或分析，通过分段处理来避免token限制
 
+    各段并发处理、按段序合并，失败的段单独重试，已成功的段不会重复请求
+
     Args:
         demand (str): 需求类型，支持 "translate"、"recommend"、"analyze"
-        text (str): 输入文本
-        chunk_size (int): 每段的最大字符数
+        text (str | list): 输入文本，或按版面分好的段落列表
+        chunk_tokens (int, optional): 翻译时每段估算token数的上限，默认为 TRANSLATE_CHUNK_TOKENS
+        overlap_tokens (int): 相邻两段重叠内容的token数上限
+        work_dir (str, optional): 分析与推荐结果的保存目录；翻译的各段结果只返回、不保存
+        max_workers (int, optional): 同时处理的段数，默认为 FETCH_LONG_WORKERS
+        retries (int, optional): 失败段的重试轮数，默认为 FETCH_LONG_RETRIES
+        detailed (bool): 为True时返回LongFetchResult（含各段状态与耗时）
 
     Returns:
-        str: 完整的处理结果
+        str | LongFetchResult: 完整的处理结果
+
+    Raises:
+        RuntimeError: 未要求detailed且重试后仍有段失败
     '''
     # 根据需求类型选择对应的函数
     demand_functions = {
-        "translate": translate,
-        "recommend": recommend,
-        "analyze": analyze
+        "translate": lambda item: _translate_html(item.chunk),
+        "recommend": lambda item: recommend(item.chunk, work_dir=work_dir),
+        "analyze": lambda item: analyze(item.chunk, work_dir=work_dir)
     }
     
     if demand not in demand_functions:
         raise ValueError(f"不支持的需求类型: {demand}")
     
     pdf_func = demand_functions[demand]
-    
-    # 如果文本较短，直接处理
-    if len(text) <= chunk_size:
-        return pdf_func(text)
-    
-    # 分割文本
-    chunks = split_text(text, chunk_size)
-    results = []
-    
-    print(f"文本过长，将分为 {len(chunks)} 段进行处理...")
-    
-    for i, chunk in enumerate(chunks, 1):
-        print(f"正在处理第 {i}/{len(chunks)} 段...")
-        try:
-            result = pdf_func(chunk)
-            results.append(result)
-        except Exception as e:
-            print(f"处理第 {i} 段时出错: {e}")
-            results.append(f"[处理第 {i} 段时出错: {e}]")
-    
-    # 合并结果
-    final_result = "\n\n".join(results)
-    return final_result
\ No newline at end of file
+    if not isinstance(text, str):
+        text = "\n\n".join(text)
+
+    chunk_tokens = chunk_tokens or TRANSLATE_CHUNK_TOKENS
+    if demand != "translate" or estimate_tokens(text) <= chunk_tokens:
+        # 较短的文本直接处理；分析与推荐对长文档自动分段摘要后汇总（map-reduce），不拼接各段的独立结果
+        chunks = [text]
+    else:
+        chunks = chunk_text(text, chunk_tokens, overlap_tokens)
+        print(f"文本过长，将分为 {len(chunks)} 段并发处理...")
+
+    result = LongFetchResult(demand, chunks)
+    workers = max(1, min(max_workers or FETCH_LONG_WORKERS, len(chunks)))
+    retries = FETCH_LONG_RETRIES if retries is None else max(0, retries)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = result.chunks
+        for attempt in range(retries + 1):
+            if attempt:
+                print(f"重试失败的 {len(pending)} 段（第 {attempt}/{retries} 次）...")
+            failed = [
+                item for item in executor.map(partial(_run_chunk, pdf_func), pending)
+                if item.status != "ok"
+            ]
+            for item in failed:
+                print(f"处理第 {item.index} 段时出错: {item.error}")
+            pending = [item for item in failed if item.retryable]
+            if not pending:
+                break
+    result.elapsed = time.monotonic() - start
+
+    if detailed:
+        return result
+    if not result.ok:
+        failed = "、".join(str(item.index) for item in result.failed)
+        raise RuntimeError(f"第 {failed} 段处理失败: {result.failed[0].error}")
+    return result.text
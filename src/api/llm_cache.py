@@ -0,0 +1,131 @@
+"""
+LLM响应缓存模块
+
+功能：
+- 以 模型+温度+最大token数+完整消息 的哈希为键，持久化缓存LLM回复（SQLite）
+- 按缓存总字节数进行LRU淘汰
+- 统计命中/未命中次数
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 默认缓存上限 512MB
+
+
+def make_cache_key(model, temperature, max_tokens, messages):
+    """
+    计算缓存键
+
+    Args:
+        model: 模型名称
+        temperature: 采样温度
+        max_tokens: 最大输出token数
+        messages: 发送给模型的完整消息列表（包含历史上下文）
+
+    Returns:
+        str: sha256十六进制摘要
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """基于SQLite的LLM回复缓存，线程安全"""
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            db_path: SQLite数据库文件路径，目录不存在时自动创建
+            max_bytes: 缓存内容总字节数上限，超出后淘汰最久未访问的条目
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)"
+            )
+
+    def get(self, key):
+        """读取缓存，命中时刷新访问时间；未命中返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """写入缓存，并在超出容量时按LRU淘汰"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未访问的条目直到总大小不超过上限（调用方持有锁）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+
+    def stats(self):
+        """
+        Returns:
+            dict: 命中数、未命中数、条目数与缓存总字节数
+        """
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def clear(self):
+        """清空缓存与计数"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,264 @@
+"""
+LLM调用的重试与超时模块
+
+功能：
+- 可重试的错误（连接失败、超时、限流、服务端5xx）按指数退避加随机抖动重试
+- 每次调用有总时限（包含所有重试与等待），每次尝试的超时不超过剩余时间
+- 可选的对冲请求：调用耗时超过近期同类调用的p95时再发出一个相同请求
+- 同步与异步两个版本：同步版本的主请求在调用方线程中执行，对冲请求在线程池中执行，
+  主请求失败时改用对冲请求的结果；异步版本取先完成的结果并取消落后的请求
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import openai
+
+RETRY_ATTEMPTS = 4  # 每次调用最多尝试的次数
+BACKOFF_BASE = 1.0  # 第一次重试前的等待上限（秒），之后每次翻倍
+BACKOFF_MAX = 30.0
+CALL_DEADLINE = 600.0  # 每次调用的总时限（秒）
+ATTEMPT_TIMEOUT = 300.0  # 单次尝试的超时（秒）
+
+# 对冲请求：默认关闭；同类调用的样本数不少于HEDGE_MIN_SAMPLES时才估计p95
+HEDGE_ENABLED = False
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200  # 每类调用保留的最近耗时样本数
+HEDGE_WORKERS = 16  # 同时进行的同步对冲请求上限，已满时不再发出对冲
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # 包含 APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+)
+
+
+class CallDeadlineExceeded(TimeoutError):
+    """调用在总时限内没有成功"""
+
+
+class LatencyTracker:
+    """按类别记录最近的调用耗时，用于估计对冲请求的触发时间"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, key, q=HEDGE_QUANTILE):
+        """
+        Returns:
+            float: 近期耗时的q分位数，样本不足时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latency_tracker = LatencyTracker()
+
+# 同步对冲请求使用的线程池（只执行对冲请求；落后的请求无法中断，会在后台运行到结束或超时）
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+def configure(attempts=None, deadline=None, attempt_timeout=None, hedge=None):
+    """修改全局的重试次数、总时限、单次超时与对冲开关"""
+    global RETRY_ATTEMPTS, CALL_DEADLINE, ATTEMPT_TIMEOUT, HEDGE_ENABLED
+    if attempts is not None:
+        RETRY_ATTEMPTS = max(1, int(attempts))
+    if deadline is not None:
+        CALL_DEADLINE = max(1.0, float(deadline))
+    if attempt_timeout is not None:
+        ATTEMPT_TIMEOUT = max(1.0, float(attempt_timeout))
+    if hedge is not None:
+        HEDGE_ENABLED = bool(hedge)
+
+
+def is_retryable(error):
+    """错误是否值得重试（参数错误、鉴权失败、已超出总时限等不重试）"""
+    return isinstance(error, RETRYABLE_ERRORS) and not isinstance(error, CallDeadlineExceeded)
+
+
+def backoff_delay(attempt):
+    """第attempt次重试前的等待时间：指数退避 + 全抖动"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+    return _hedge_executor
+
+def _submit_hedge(func, timeout):
+    """
+    在线程池中发出对冲请求
+
+    Returns:
+        Future: 对冲请求；线程池已满（HEDGE_WORKERS个对冲请求在进行中）时返回None，不排队等待
+    """
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    try:
+        future = _get_hedge_executor().submit(func, timeout)
+    except BaseException:
+        _hedge_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def _attempt_timeout(end):
+    """本次尝试的超时：不超过ATTEMPT_TIMEOUT与剩余的总时限，总时限已到时抛出CallDeadlineExceeded"""
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        raise CallDeadlineExceeded("LLM调用超出总时限")
+    return min(ATTEMPT_TIMEOUT, remaining)
+
+def _hedge_after(key, hedge):
+    if not (HEDGE_ENABLED if hedge is None else hedge):
+        return None
+    return latency_tracker.quantile(key)
+
+
+def _attempt_hedged(func, timeout, hedge_after, end):
+    """
+    执行一次尝试：主请求在调用方线程中执行，超过hedge_after秒仍未完成时在线程池中发出一个相同请求
+    同步请求无法中断，主请求成功即返回其结果；主请求失败时改用对冲请求的结果，等待不超过总时限end
+    """
+    primary_done = threading.Event()
+    hedges = []
+
+    def launch():
+        if not primary_done.is_set():
+            future = _submit_hedge(func, min(timeout, end - time.monotonic()))
+            if future is not None:
+                hedges.append(future)
+
+    timer = threading.Timer(hedge_after, launch)
+    timer.daemon = True
+    timer.start()
+    try:
+        return func(timeout)
+    except Exception as e:
+        primary_done.set()
+        timer.cancel()
+        timer.join()
+        if not hedges:
+            raise
+        try:
+            return hedges[0].result(timeout=max(0.0, end - time.monotonic()))
+        except FutureTimeoutError:
+            raise CallDeadlineExceeded(f"LLM调用超出总时限: {e}") from e
+        except Exception:
+            raise e
+    finally:
+        primary_done.set()
+        timer.cancel()
+
+
+def call_with_retry(func, key=None, deadline=None, hedge=None):
+    """
+    带重试、总时限与可选对冲的同步调用
+
+    Args:
+        func: func(timeout) 执行一次请求，timeout为本次尝试允许的秒数
+        key: 耗时统计的类别（对冲请求按同类调用的p95触发）
+        deadline: 总时限（秒），默认为CALL_DEADLINE
+        hedge: 是否允许对冲，默认为HEDGE_ENABLED
+
+    Raises:
+        不可重试的错误原样抛出；重试用尽时抛出最后一次的错误；超出总时限时抛出CallDeadlineExceeded
+    """
+    end = time.monotonic() + (deadline or CALL_DEADLINE)
+    for attempt in range(RETRY_ATTEMPTS):
+        timeout = _attempt_timeout(end)
+        start = time.monotonic()
+        try:
+            hedge_after = _hedge_after(key, hedge)
+            if hedge_after is not None and hedge_after < timeout:
+                result = _attempt_hedged(func, timeout, hedge_after, end)
+            else:
+                result = func(timeout)
+            latency_tracker.record(key, time.monotonic() - start)
+            return result
+        except Exception as e:
+            if not is_retryable(e) or attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt)
+            if time.monotonic() + delay >= end:
+                raise CallDeadlineExceeded(f"LLM调用超出总时限: {e}") from e
+            print(f"LLM调用失败，{delay:.1f}秒后重试（{attempt + 1}/{RETRY_ATTEMPTS - 1}）: {e}")
+            time.sleep(delay)
+
+
+async def _aattempt_hedged(func, timeout, hedge_after, end):
+    tasks = [asyncio.ensure_future(func(timeout))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(func(min(timeout, end - time.monotonic()))))
+        error = None
+        pending = set(tasks)
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise CallDeadlineExceeded("LLM调用超出总时限")
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def acall_with_retry(func, key=None, deadline=None, hedge=None):
+    """
+    call_with_retry() 的异步版本
+
+    Args:
+        func: async func(timeout) 执行一次请求
+    """
+    end = time.monotonic() + (deadline or CALL_DEADLINE)
+    for attempt in range(RETRY_ATTEMPTS):
+        timeout = _attempt_timeout(end)
+        start = time.monotonic()
+        try:
+            hedge_after = _hedge_after(key, hedge)
+            if hedge_after is not None and hedge_after < timeout:
+                result = await _aattempt_hedged(func, timeout, hedge_after, end)
+            else:
+                result = await func(timeout)
+            latency_tracker.record(key, time.monotonic() - start)
+            return result
+        except Exception as e:
+            if not is_retryable(e) or attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt)
+            if time.monotonic() + delay >= end:
+                raise CallDeadlineExceeded(f"LLM调用超出总时限: {e}") from e
+            print(f"LLM调用失败，{delay:.1f}秒后重试（{attempt + 1}/{RETRY_ATTEMPTS - 1}）: {e}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,137 @@
+"""
+共享图片资源库模块
+
+功能：
+- 以嵌入图片原始数据的哈希为键，保存提取后的图片，跨任务复用（同一logo/图片只解码与保存一次）
+- 任务目录中的图片以硬链接引用资源库文件，任务清理或资源库淘汰互不影响
+- 按总字节数淘汰最久未使用的资源：内存索引记录大小与访问时间，超限时一次淘汰到低水位
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 默认上限 1GB
+EVICT_LOW_WATER = 0.9  # 超出上限时淘汰到上限的该比例
+
+
+def content_digest(data):
+    """图片原始数据的内容哈希"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def link_file(source, target):
+    """将source以硬链接放到target（已存在则替换），不支持硬链接时复制"""
+    # 已经是同一个文件时rename不会生效，直接返回
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    # 临时文件名区分进程与线程，多个提取进程可能同时链接到同一目标
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.link"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+class AssetStore:
+    """内容寻址的图片资源库，目录结构为 <root>/<哈希前两位>/<哈希><扩展名>"""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 内存索引：路径 -> [访问时间, 大小]，首次写入时扫描一次目录建立，之后不再扫描；
+        # 多进程提取时各进程的索引互不同步，总大小为近似值
+        self._index = None
+        self._total = 0
+
+    def __getstate__(self):
+        # 多进程提取时只传递路径与上限
+        return {"root": self.root, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"], state["max_bytes"])
+
+    def _path(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest + ext)
+
+    def link_to(self, digest, target, ext=".png"):
+        """
+        将资源链接到target，命中时刷新访问时间
+        查找与链接都在锁内完成，不会与本进程的淘汰交错
+
+        Returns:
+            bool: 是否链接成功；资源不存在或已被其他提取进程淘汰时返回False，调用方应重新解码图片
+        """
+        path = self._path(digest, ext)
+        with self._lock:
+            try:
+                os.utime(path)
+                link_file(path, target)
+            except OSError:
+                if self._index is not None and path in self._index:
+                    self._total -= self._index.pop(path)[1]
+                return False
+            if self._index is not None and path in self._index:
+                self._index[path][0] = time.time()
+        return True
+
+    def put(self, digest, file_path, ext=".png"):
+        """以硬链接（或复制）将file_path存入资源库，超出上限时淘汰旧资源"""
+        path = self._path(digest, ext)
+        if os.path.exists(path):
+            return path
+        link_file(file_path, path)
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            else:
+                self._add(path, time.time(), os.path.getsize(path))
+            if self._total > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _add(self, path, atime, size):
+        old = self._index.get(path)
+        if old is not None:
+            self._total -= old[1]
+        self._index[path] = [atime, size]
+        self._total += size
+
+    def _load_index(self):
+        """扫描目录重建索引（调用方持有锁）"""
+        self._index, self._total = {}, 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self._add(path, stat.st_mtime, stat.st_size)
+
+    def _evict(self, keep):
+        """
+        淘汰最久未使用的资源直到总大小不超过上限的EVICT_LOW_WATER（调用方持有锁）；
+        一次淘汰到低水位，之后的写入在再次超限前不需要淘汰
+        """
+        target = self.max_bytes * EVICT_LOW_WATER
+        for path, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+            if self._total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # 已被其他进程淘汰
+            except OSError:
+                continue
+            del self._index[path]
+            self._total -= size
@@ -72,7 +72,17 @@ def text_extract(pdf_path=PDF_PATH):
     finally:
         doc.close()
 
+    save_text(pdf_path, text)
+    return text
+
+def save_text(pdf_path, text_pages):
+    """
+    将逐页文本保存为PDF同目录下的text_ori.txt
+
+    Args:
+        pdf_path: PDF文件路径
+        text_pages: 每页文本内容的列表
+    """
     text_file_path = os.path.join(os.path.dirname(pdf_path), "text_ori.txt")
     with open(text_file_path, 'w', encoding='utf-8') as f:
-        f.write(" ".join(text))
-    return text
+        f.write(" ".join(text_pages))
@@ -4,20 +4,66 @@ HTML内容与图片整合模块
 功能：
 - html文件处理：process_html_with_images() - 替换html文件中的图片引用
 - 智能匹配图片文件（常规图片和图表截图）
+- 图片引用方式：base64内嵌（data URI）或静态文件URL（浏览器可缓存，页面html体积小）
 - 自动创建处理后的文件到指定目录
 """
 
 import os
 import re
 import glob
+import base64
+import mimetypes
+from pathlib import Path
+from urllib.parse import quote
 
-def html_img_replace(html_file_path, output_dir="temp/html/final"):
+# 图片引用方式：base64内嵌 / 静态文件URL
+IMAGE_MODES = ("base64", "url")
+
+# 可引用的图片格式（图片压缩后可能为webp/jpg）
+IMAGE_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg")
+
+# Gradio提供文件访问的路由前缀，文件须位于launch的allowed_paths之内
+DEFAULT_URL_PREFIX = "/file="
+
+def _image_src(img_path, image_mode, url_prefix):
+    """
+    生成img标签的src
+
+    Args:
+        img_path: 图片文件路径
+        image_mode: "base64" 返回data URI，"url" 返回静态文件URL
+        url_prefix: url模式下的路由前缀
+    """
+    if image_mode == "url":
+        abs_path = Path(img_path).resolve().as_posix()
+        return f"{url_prefix}{quote(abs_path, safe='/:')}"
+
+    with open(img_path, 'rb') as img_file:
+        img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+    mime_type = mimetypes.guess_type(img_path)[0] or 'image/png'
+    return f"data:{mime_type};base64,{img_base64}"
+
+def _glob_images(image_dir, patterns):
+    """按文件名模式（不含扩展名）搜索目录中的图片"""
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(image_dir, pattern + ".*")):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                files.add(path)
+    return sorted(files)
+
+def html_img_replace(html_file_path, output_dir="temp/html/final", picture_dir="temp/picture", figures_dir="temp/figures",
+                     image_mode="base64", url_prefix=DEFAULT_URL_PREFIX):
     """
     处理单个HTML文件，替换其中的图片引用并保存到新位置
     
     Args:
         html_file_path: 待处理的HTML文件路径
         output_dir: 输出目录，默认为"temp/html/final"
+        picture_dir: 嵌入图片目录，默认为"temp/picture"
+        figures_dir: 图表截图目录，默认为"temp/figures"
+        image_mode: 图片引用方式，"base64"内嵌为data URI，"url"引用静态文件URL
+        url_prefix: url模式下的路由前缀，默认为Gradio的"/file="
     
     Returns:
         str: 替换图片路径后的HTML内容
@@ -26,6 +72,9 @@ def html_img_replace(html_file_path, output_dir="temp/html/final"):
         在output_dir中创建处理后的HTML文件
     """
     
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"未知的图片引用方式: {image_mode}")
+
     # 检查输入文件是否存在
     if not os.path.exists(html_file_path):
         raise FileNotFoundError(f"HTML文件不存在: {html_file_path}")
@@ -45,10 +94,6 @@ def html_img_replace(html_file_path, output_dir="temp/html/final"):
     except Exception as e:
         raise IOError(f"读取HTML文件失败: {e}")
     
-    # 定义图片目录路径
-    picture_dir = "temp/picture"
-    figures_dir = "temp/figures"
-    
     # 统计HTML中的所有img标签数量
     img_tag_pattern = r'<img[^>]*src="[^"]*"[^>]*>'
     all_img_tags = re.findall(img_tag_pattern, html_content, re.IGNORECASE)
@@ -61,26 +106,20 @@ def html_img_replace(html_file_path, output_dir="temp/html/final"):
     # 搜索picture目录中的图片
     if os.path.exists(picture_dir):
         picture_patterns = [
-            f"page_{page_num}_img_*.png",
-            f"page_{page_num}_*.png",
-            f"page{page_num}_*.png"
+            f"page_{page_num}_img_*",
+            f"page_{page_num}_*",
+            f"page{page_num}_*"
         ]
-        for pattern in picture_patterns:
-            files = glob.glob(os.path.join(picture_dir, pattern))
-            picture_files.extend(files)
-        picture_files = sorted(list(set(picture_files)))
+        picture_files = _glob_images(picture_dir, picture_patterns)
     
     # 搜索figures目录中的图片
     if os.path.exists(figures_dir):
         figure_patterns = [
-            f"page_{page_num}_fig_*.png",
-            f"page_{page_num}_figure_*.png",
-            f"figure_{page_num}_*.png"
+            f"page_{page_num}_fig_*",
+            f"page_{page_num}_figure_*",
+            f"figure_{page_num}_*"
         ]
-        for pattern in figure_patterns:
-            files = glob.glob(os.path.join(figures_dir, pattern))
-            figures_files.extend(files)
-        figures_files = sorted(list(set(figures_files)))
+        figures_files = _glob_images(figures_dir, figure_patterns)
     
     # 智能选择图片文件夹
     if total_placeholders > 0:
@@ -116,21 +155,11 @@ def html_img_replace(html_file_path, output_dir="temp/html/final"):
             img_path = page_images[img_index]
             
             try:
-                # 读取图片文件并转换为base64
-                import base64
-                with open(img_path, 'rb') as img_file:
-                    img_data = img_file.read()
-                    img_base64 = base64.b64encode(img_data).decode('utf-8')
-                    
-              
-                mime_type = 'image/png'  # 默认为png
-                
-                # 生成data URI
-                data_uri = f"data:{mime_type};base64,{img_base64}"
+                img_src = _image_src(img_path, image_mode, url_prefix)
                 
                 original_tag = match.group(0)
-                # 使用正则表达式替换src属性
-                new_img_tag = re.sub(r'src="[^"]*"', f'src="{data_uri}"', original_tag, flags=re.IGNORECASE)
+                # 使用正则表达式替换src属性（lambda避免src中的字符被当作转义序列）
+                new_img_tag = re.sub(r'src="[^"]*"', lambda _: f'src="{img_src}"', original_tag, flags=re.IGNORECASE)
                 
                 img_index += 1
                 return new_img_tag
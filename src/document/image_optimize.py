@@ -0,0 +1,131 @@
+"""
+图片压缩模块
+
+功能：
+- 将提取出的图片缩小到显示宽度，按内容类型选择编码：
+  照片类 -> WebP（不支持时为JPEG），线条图/图表类 -> 优化的PNG（颜色数不超过256时转为调色板）
+- 可选保留原始全分辨率图片（保存在 original 子目录，用于放大查看）
+"""
+
+import os
+import shutil
+from PIL import Image, features
+
+DISPLAY_WIDTH = 1600  # 显示宽度（阅读栏约800px，按2倍屏计算）
+PHOTO_QUALITY = 80  # 照片类的有损压缩质量
+ORIGINAL_SUBDIR = "original"
+SOURCE_EXTENSIONS = (".png",)
+
+# 线条图判定：缩略图中出现最多的若干种颜色覆盖的像素比例
+LINE_ART_TOP_COLORS = 8
+LINE_ART_COVERAGE = 0.8
+
+
+def is_line_art(image):
+    """
+    判断图片是否为线条图/图表（大面积纯色、颜色集中），否则视为照片
+
+    Args:
+        image: PIL图片
+    """
+    # 最近邻采样，避免插值产生的过渡色干扰判断
+    scale = min(1.0, 128 / max(image.width, image.height))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    thumb = image.convert("RGB").resize(size, Image.Resampling.NEAREST)
+    total = thumb.width * thumb.height
+    colors = thumb.getcolors(maxcolors=total)
+    if not colors:
+        return False
+    top = sorted((count for count, _ in colors), reverse=True)[:LINE_ART_TOP_COLORS]
+    return sum(top) / total >= LINE_ART_COVERAGE
+
+
+def _encode(image, base_path, line_art):
+    """
+    按内容类型编码图片
+
+    Returns:
+        str: 写入的文件路径
+    """
+    if line_art:
+        if image.mode not in ("RGB", "L", "P"):
+            image = image.convert("RGB")
+        # 颜色数不超过256时无损转为调色板PNG
+        if image.mode == "RGB" and image.getcolors(maxcolors=256) is not None:
+            image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        output_path = base_path + ".png"
+        image.save(output_path, "png", optimize=True)
+    elif features.check("webp"):
+        output_path = base_path + ".webp"
+        image.convert("RGB").save(output_path, "webp", quality=PHOTO_QUALITY, method=4)
+    else:
+        output_path = base_path + ".jpg"
+        image.convert("RGB").save(output_path, "jpeg", quality=PHOTO_QUALITY, optimize=True, progressive=True)
+    return output_path
+
+
+def optimize_image(image_path, display_width=DISPLAY_WIDTH, keep_original=False):
+    """
+    缩小并重新编码单张图片，失败或无收益时保留原文件
+
+    Args:
+        image_path: 图片路径（PNG）
+        display_width: 显示宽度，更宽的图片等比缩小到该宽度
+        keep_original: 是否将原图移动到同目录的 original 子目录
+
+    Returns:
+        str: 处理后的图片路径
+    """
+    base_path = os.path.splitext(image_path)[0]
+    tmp_base = base_path + ".opt"
+    try:
+        with Image.open(image_path) as image:
+            image.load()
+        # 在缩放前判断内容类型
+        line_art = is_line_art(image)
+        resized = image.width > display_width
+        if resized:
+            height = max(1, round(image.height * display_width / image.width))
+            image = image.resize((display_width, height), Image.Resampling.LANCZOS)
+        tmp_path = _encode(image, tmp_base, line_art)
+    except Exception as e:
+        print(f"图片压缩失败 {image_path}: {e}")
+        return image_path
+
+    # 未缩小且编码后没有变小时保留原文件
+    if not resized and os.path.getsize(tmp_path) >= os.path.getsize(image_path):
+        os.remove(tmp_path)
+        return image_path
+
+    if keep_original:
+        original_dir = os.path.join(os.path.dirname(image_path), ORIGINAL_SUBDIR)
+        os.makedirs(original_dir, exist_ok=True)
+        shutil.move(image_path, os.path.join(original_dir, os.path.basename(image_path)))
+    else:
+        os.remove(image_path)
+
+    output_path = base_path + os.path.splitext(tmp_path)[1]
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def optimize_images(image_dir, display_width=DISPLAY_WIDTH, keep_original=False):
+    """
+    处理目录下提取出的所有图片
+
+    Args:
+        image_dir: 图片目录（picture 或 figures）
+        display_width: 显示宽度
+        keep_original: 是否保留原始全分辨率图片
+
+    Returns:
+        list: 处理后的图片路径列表
+    """
+    if not os.path.isdir(image_dir):
+        return []
+    outputs = []
+    for filename in sorted(os.listdir(image_dir)):
+        image_path = os.path.join(image_dir, filename)
+        if os.path.isfile(image_path) and filename.lower().endswith(SOURCE_EXTENSIONS):
+            outputs.append(optimize_image(image_path, display_width, keep_original))
+    return outputs
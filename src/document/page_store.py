@@ -0,0 +1,124 @@
+"""
+页面HTML存储模块
+
+功能：
+- PageManifest：任务级页面清单，记录每页各阶段（original/final）文件的路径、mtime与大小，
+  同步写入工作目录下的 manifest.json
+- PageCache：进程内页面内容缓存，按文件mtime与大小判断是否需要重新读取，按总字节数LRU淘汰
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+MANIFEST_NAME = "manifest.json"
+PAGE_STAGES = ("original", "final")
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024  # 页面缓存默认上限 64MB
+
+
+class PageManifest:
+    """一个任务已生成页面的清单"""
+
+    def __init__(self, work_dir):
+        self.work_dir = str(work_dir)
+        self.path = os.path.join(self.work_dir, MANIFEST_NAME)
+        self._pages = {}  # 页码 -> {阶段: {"path", "mtime", "size"}}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._pages = {int(page): stages for page, stages in data.get("pages", {}).items()}
+            except Exception as e:
+                print(f"读取页面清单失败: {e}")
+
+    def record(self, page_num, stage, file_path):
+        """
+        记录某页某阶段的文件（文件写入完成后调用）
+
+        Args:
+            page_num: 页码
+            stage: "original" 或 "final"
+            file_path: 页面文件路径
+        """
+        if stage not in PAGE_STAGES:
+            raise ValueError(f"未知的页面阶段: {stage}")
+        stat = os.stat(file_path)
+        entry = {
+            "path": os.path.relpath(file_path, self.work_dir),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+        }
+        with self._lock:
+            self._pages.setdefault(page_num, {})[stage] = entry
+            self._save()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 页码 -> {阶段: {"path"(绝对路径), "mtime", "size"}}
+        """
+        with self._lock:
+            return {
+                page: {
+                    stage: dict(entry, path=os.path.join(self.work_dir, entry["path"]))
+                    for stage, entry in stages.items()
+                }
+                for page, stages in self._pages.items()
+            }
+
+    def _save(self):
+        """原子写入manifest.json（调用方持有锁）"""
+        tmp_path = self.path + ".tmp"
+        data = {"pages": {str(page): stages for page, stages in sorted(self._pages.items())}}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class PageCache:
+    """按文件路径缓存页面内容，mtime或大小变化时重新读取"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # 路径 -> (mtime, size, 内容)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def read(self, path, mtime, size):
+        """
+        读取页面内容，清单中的mtime与大小和缓存一致时直接返回缓存
+
+        Raises:
+            OSError: 文件读取失败
+        """
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == mtime and cached[1] == size:
+                self._entries.move_to_end(path)
+                return cached[2]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._total -= old[1]
+            if size <= self.max_bytes:
+                self._entries[path] = (mtime, size, content)
+                self._total += size
+                while self._total > self.max_bytes:
+                    _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                    self._total -= evicted_size
+        return content
+
+    def discard_prefix(self, prefix):
+        """移除某目录下的所有缓存（任务被清理时调用）"""
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                self._total -= self._entries.pop(path)[1]
+
+
+page_cache = PageCache()
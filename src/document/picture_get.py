@@ -6,16 +6,104 @@ PDF图片提取模块
 - 智能过滤无关图片（logo、装饰图等）
 - 基于Figure标题的高精度截图提取
 - 支持多种标题格式（Fig./Figure，大小写不敏感）
+- PageLayout：每页的文本块与图片位置只解析一次，供各筛选/定位函数共用
+- 重叠查询使用每页的网格空间索引（RectIndex）与numpy向量化计算
+- 按图片原始数据的内容哈希去重：同一内容只解码与筛选一次，重复出现时以硬链接引用
 """
 
-from PIL import Image
+from PIL import Image, ImageStat
 from io import BytesIO
 import re
 import fitz  
 import os
+from functools import cached_property
+import numpy as np
+
+from src.document.rect_index import RectIndex
+from src.document.asset_store import content_digest, link_file
+from src.document.image_optimize import DISPLAY_WIDTH
 
 PDF_PATH = "src/document/article.pdf"
 
+# figure截图分辨率：按显示宽度推算缩放倍数，并限制在[最小, 最大]倍之间
+FIGURE_TARGET_WIDTH = DISPLAY_WIDTH
+FIGURE_MIN_ZOOM = 1.0
+FIGURE_MAX_ZOOM = 8.0
+# 单张截图（单个pixmap）的像素上限，超出时降低缩放倍数，限制渲染时的峰值内存
+FIGURE_MAX_PIXELS = 4_000_000
+# 嵌入图片预筛：尺寸下限（像素），纯色判断使用的缩略图边长与灰度标准差阈值
+MIN_IMAGE_PIXELS = 50
+TRIAGE_THUMB_SIZE = 128
+FLAT_STD_THRESHOLD = 10
+
+# 图片目录下按内容哈希保存副本的子目录，重复内容从这里链接
+CONTENT_SUBDIR = ".content"
+
+class PageLayout:
+    """
+    单页版面信息：文本dict、文本块矩形与图片矩形只解析一次，供所有启发式判断共用
+    各项在首次使用时解析，没有图片或标题的页面不会解析文本
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.rect = page.rect
+        self._image_rects = {}
+
+    @cached_property
+    def text(self):
+        """页面纯文本（get_text("text")）"""
+        return self.page.get_text("text")
+
+    @cached_property
+    def text_blocks(self):
+        """含文字的块（顺序与get_text("dict")一致）"""
+        return [block for block in self.page.get_text("dict")["blocks"] if "lines" in block]
+
+    @cached_property
+    def text_rects(self):
+        return [fitz.Rect(block["bbox"]) for block in self.text_blocks]
+
+    @cached_property
+    def block_texts(self):
+        return [
+            " ".join(" ".join(span["text"] for span in line["spans"]) for line in block["lines"])
+            for block in self.text_blocks
+        ]
+
+    @cached_property
+    def block_word_counts(self):
+        return [
+            sum(len(span["text"].split()) for line in block["lines"] for span in line["spans"])
+            for block in self.text_blocks
+        ]
+
+    @cached_property
+    def images(self):
+        return self.page.get_images(full=True)
+
+    def image_rects(self, xref):
+        """图片在本页中的所有位置"""
+        if xref not in self._image_rects:
+            self._image_rects[xref] = self.page.get_image_rects(xref)
+        return self._image_rects[xref]
+
+    @cached_property
+    def all_image_rects(self):
+        """本页所有图片的位置（按get_images顺序）"""
+        return [rect for img in self.images for rect in self.image_rects(img[0])]
+
+    @cached_property
+    def text_index(self):
+        """文本块矩形的空间索引（下标与text_blocks一致）"""
+        return RectIndex(self.text_rects, self.rect)
+
+    @cached_property
+    def image_index(self):
+        """图片位置的空间索引（下标与all_image_rects一致）"""
+        return RectIndex(self.all_image_rects, self.rect)
+
+
 def pic_extract(pdf_path=PDF_PATH):
     """
     提取PDF中的学术相关图片并保存为PNG文件
@@ -33,91 +121,189 @@ def pic_extract(pdf_path=PDF_PATH):
     picture_dir = os.path.join(os.path.dirname(pdf_path), "picture")
     os.makedirs(picture_dir, exist_ok=True)
     
-    # 记录已处理的图片，避免重复
+    # 记录已处理的图片（xref与内容哈希），避免重复
     processed_images = set()
+    content_cache = {}
 
     try:
         for page_num, page in enumerate(doc):
-            page_img_count = 0  # 每页单独计数
-            
-            for img in page.get_images(full=True):
-                # 使用图片的MD5哈希作为唯一标识符
-                img_index = img[0]  # 图片在文档中的索引
-                
-                # 避免重复处理同一张图片
-                if img_index in processed_images:
-                    continue
-                
-                # 获取图片位置信息
-                img_rects = page.get_image_rects(img_index)
-                if not img_rects:
-                    continue
-                
-                # 合并同一图片的多个位置区域，取最大边界
-                combined_rect = img_rects[0]
-                for rect in img_rects[1:]:
-                    combined_rect = fitz.Rect(
-                        min(combined_rect.x0, rect.x0),
-                        min(combined_rect.y0, rect.y0), 
-                        max(combined_rect.x1, rect.x1),
-                        max(combined_rect.y1, rect.y1)
-                    )
-                
-                # 使用筛选函数判断是否为学术相关图片
-                if not _is_academic_relevant_image(page, combined_rect):
-                    continue  # 跳过无关图片
-                
-                try:
-                    base_image = doc.extract_image(img_index)
-                    image = Image.open(BytesIO(base_image["image"]))
-                    
-                    # 检查图片尺寸，过滤过小的图片
-                    if image.width < 50 or image.height < 50:
-                        continue
-                    
-                    # 简单的图片内容检查：检查是否为单色或几乎单色的图片
-                    # 这类图片可能是背景、分隔线等装饰元素
-                    if image.mode in ['RGB', 'RGBA']:
-                        # 转换为灰度来简化分析
-                        gray_image = image.convert('L')
-                        # 计算像素值的标准差，标准差很小说明颜色变化很小
-                        import numpy as np
-                        pixels = np.array(gray_image)
-                        pixel_std = np.std(pixels)
-                        
-                        # 如果标准差很小，可能是单色背景
-                        if pixel_std < 10:  # 标准差阈值
-                            continue
-
-                    # CMYK转RGB
-                    if image.mode == 'CMYK':
-                        image = image.convert('RGB')
-                    elif image.mode not in ['RGB', 'L']:
-                        image = image.convert('RGB')
-        
-                    filepath = os.path.join(picture_dir, f"page_{page_num + 1}_img_{page_img_count + 1}.png")
-                    image.save(filepath, "png")
-                    saved_files.append(filepath)
-                    
-                    # 标记为已处理并更新计数
-                    processed_images.add(img_index)
-                    page_img_count += 1
-                    
-                except Exception as e:
-                    continue
-                    
+            saved_files.extend(extract_page_images(doc, PageLayout(page), page_num, picture_dir, processed_images,
+                                                   content_cache=content_cache))
     finally:
         doc.close()
 
     return saved_files
 
-def _is_academic_relevant_image(page, img_rect, min_size=40):
+def extract_page_images(doc, layout, page_num, picture_dir, processed_images, saved_xrefs=None,
+                        content_cache=None, assets=None):
+    """
+    提取单页中的学术相关图片并保存为PNG文件
+
+    Args:
+        doc: 已打开的fitz文档
+        layout: 该页的PageLayout
+        page_num: 页码（从0开始）
+        picture_dir: 保存目录
+        processed_images: 已处理图片xref的集合，跨页共享以避免重复提取
+        saved_xrefs: 可选列表，按保存顺序追加本页保存图片的 (xref, 内容哈希)（多进程提取时用于合并去重）
+        content_cache: 可选字典，内容哈希 -> 已保存的图片路径（内容被筛掉时为None），跨页共享
+        assets: 可选的AssetStore，跨任务共享已提取的图片
+
+    Returns:
+        list: 本页保存的图片文件路径列表
+    """
+    saved_files = []
+    page_img_count = 0  # 每页单独计数
+
+    for img in layout.images:
+        # 使用图片的MD5哈希作为唯一标识符
+        img_index = img[0]  # 图片在文档中的索引
+
+        # 避免重复处理同一张图片
+        if img_index in processed_images:
+            continue
+
+        # 按get_images给出的原始尺寸预筛，过小的图片无需读取数据
+        if img[2] < MIN_IMAGE_PIXELS or img[3] < MIN_IMAGE_PIXELS:
+            continue
+
+        # 获取图片位置信息
+        img_rects = layout.image_rects(img_index)
+        if not img_rects:
+            continue
+
+        # 合并同一图片的多个位置区域，取最大边界
+        combined_rect = img_rects[0]
+        for rect in img_rects[1:]:
+            combined_rect = fitz.Rect(
+                min(combined_rect.x0, rect.x0),
+                min(combined_rect.y0, rect.y0), 
+                max(combined_rect.x1, rect.x1),
+                max(combined_rect.y1, rect.y1)
+            )
+
+        # 使用筛选函数判断是否为学术相关图片
+        if not _is_academic_relevant_image(layout, combined_rect):
+            continue  # 跳过无关图片
+
+        try:
+            filepath = os.path.join(picture_dir, f"page_{page_num + 1}_img_{page_img_count + 1}.png")
+            base_image = doc.extract_image(img_index)
+            digest = content_digest(base_image["image"])
+
+            # 相同内容已处理过：从内容副本引用，无需再次解码与筛选
+            if content_cache is not None and digest in content_cache:
+                source = content_cache[digest]
+                if source is None:
+                    continue
+            else:
+                source = _find_content(picture_dir, digest, assets, content_cache, filepath)
+            if source is not None:
+                link_file(source, filepath)
+                _record_saved(filepath, img_index, digest, saved_files, saved_xrefs, processed_images, content_cache)
+                page_img_count += 1
+                continue
+
+            # 内容被筛掉时记录，后续相同内容直接跳过
+            if content_cache is not None:
+                content_cache[digest] = None
+
+            # Image.open只解析文件头，像素数据在真正使用时才解码
+            image = Image.open(BytesIO(base_image["image"]))
+
+            # 检查图片尺寸，过滤过小的图片
+            if image.width < MIN_IMAGE_PIXELS or image.height < MIN_IMAGE_PIXELS:
+                continue
+
+            # 简单的图片内容检查：检查是否为单色或几乎单色的图片
+            # 这类图片可能是背景、分隔线等装饰元素
+            if image.mode in ['RGB', 'RGBA'] and _is_flat_image(base_image["image"], image):
+                continue
+
+            # CMYK转RGB
+            if image.mode == 'CMYK':
+                image = image.convert('RGB')
+            elif image.mode not in ['RGB', 'L']:
+                image = image.convert('RGB')
+
+            image.save(filepath, "png")
+            if content_cache is not None:
+                # page_N_img_K会被后续的图片压缩替换，重复内容从不会被改动的内容副本链接
+                link_file(filepath, content_path(picture_dir, digest))
+            if assets is not None:
+                assets.put(digest, filepath)
+
+            # 标记为已处理并更新计数
+            _record_saved(filepath, img_index, digest, saved_files, saved_xrefs, processed_images, content_cache)
+            page_img_count += 1
+
+        except Exception as e:
+            print(f"提取第{page_num + 1}页图片(xref {img_index})失败: {e}")
+            continue
+
+    return saved_files
+
+
+def content_path(picture_dir, digest):
+    """图片目录下按内容哈希保存的副本路径（图片压缩不会处理子目录中的文件）"""
+    return os.path.join(picture_dir, CONTENT_SUBDIR, digest + ".png")
+
+
+def _find_content(picture_dir, digest, assets, content_cache, filepath):
+    """
+    查找已保存过的相同内容：本文档的内容副本（可能由其他提取进程写入），其次为共享资源库
+
+    Returns:
+        str: 可链接到filepath的文件路径，未找到时返回None
+    """
+    if content_cache is None:
+        # 资源库中的文件可能随时被淘汰，直接链接到目标位置
+        if assets is not None and assets.link_to(digest, filepath):
+            return filepath
+        return None
+    path = content_path(picture_dir, digest)
+    # 资源库中的文件先链接为内容副本，本文档后续的重复内容从内容副本引用
+    if os.path.exists(path) or (assets is not None and assets.link_to(digest, path)):
+        content_cache[digest] = path
+        return path
+    return None
+
+
+def _record_saved(filepath, xref, digest, saved_files, saved_xrefs, processed_images, content_cache):
+    """记录一张已保存的图片"""
+    saved_files.append(filepath)
+    if saved_xrefs is not None:
+        saved_xrefs.append((xref, digest))
+    processed_images.add(xref)
+    if content_cache is not None:
+        content_cache[digest] = content_path(os.path.dirname(filepath), digest)
+
+def _is_flat_image(data, image):
+    """
+    在小尺寸缩略图上判断图片是否为单色或几乎单色（灰度标准差很小）
+
+    JPEG通过draft在解码时直接按比例缩小，其他格式解码一次后最近邻缩小，
+    解码结果留在image中供保存时复用
+    """
+    if image.format == "JPEG":
+        probe = Image.open(BytesIO(data))
+        # 解码缩放过大会平均掉细节纹理，先解码到缩略图的4倍再最近邻缩小
+        probe.draft("RGB", (TRIAGE_THUMB_SIZE * 4, TRIAGE_THUMB_SIZE * 4))
+    else:
+        probe = image
+    # 最近邻采样保留像素值的分布，避免插值平滑使标准差偏小
+    scale = min(1.0, TRIAGE_THUMB_SIZE / max(probe.width, probe.height))
+    size = (max(1, round(probe.width * scale)), max(1, round(probe.height * scale)))
+    thumb = probe.resize(size, Image.Resampling.NEAREST).convert("L")
+    return ImageStat.Stat(thumb).stddev[0] < FLAT_STD_THRESHOLD
+
+def _is_academic_relevant_image(layout, img_rect, min_size=40):
     """
     判断图片是否为学术相关内容
     
     筛选策略：尺寸、位置、宽高比、周围文本关键词
     """
-    page_rect = page.rect
+    page_rect = layout.rect
     
     # 1. 尺寸筛选：过小的图片通常是装饰性的
     if img_rect.width < min_size or img_rect.height < min_size:
@@ -138,17 +324,9 @@ def _is_academic_relevant_image(page, img_rect, min_size=40):
         return False
     
     # 4. 检查是否为纯文本区域（避免提取标题等文本内容）
-    blocks = page.get_text("dict")["blocks"]
-    
     # 计算图片区域内的文字密度
-    text_in_image_area = 0
-    for block in blocks:
-        if "lines" in block:
-            block_rect = fitz.Rect(block["bbox"])
-            if _rects_overlap(block_rect, img_rect):
-                overlap_rect = _get_overlap_rect(block_rect, img_rect)
-                if overlap_rect:
-                    text_in_image_area += overlap_rect.width * overlap_rect.height
+    _, overlap_areas = layout.text_index.overlap_areas(img_rect)
+    text_in_image_area = float(overlap_areas.sum())
     
     # 如果图片区域内文字密度过高，可能是纯文本，跳过
     image_area = img_rect.width * img_rect.height
@@ -175,13 +353,10 @@ def _is_academic_relevant_image(page, img_rect, min_size=40):
     
     # 获取搜索区域内的文本
     nearby_text = ""
-    for block in blocks:
-        if "lines" in block:
-            block_rect = fitz.Rect(block["bbox"])
-            if _rects_overlap(block_rect, search_area):
-                for line in block["lines"]:
-                    line_text = " ".join(span["text"] for span in line["spans"])
-                    nearby_text += line_text + " "
+    for i in layout.text_index.overlapping(search_area):
+        for line in layout.text_blocks[i]["lines"]:
+            line_text = " ".join(span["text"] for span in line["spans"])
+            nearby_text += line_text + " "
     
     # 检查是否包含学术关键词
     nearby_text_lower = nearby_text.lower()
@@ -209,7 +384,7 @@ def fig_screenshot(pdf_path=PDF_PATH):
     Returns:
         list: figure信息字典列表，包含页码、编号、标题、截图路径等
     
-    特点：支持多种标题格式，智能定位，8倍高精度截图，避免重复处理
+    特点：支持多种标题格式，智能定位，按目标尺寸自适应分辨率截图，避免重复处理
     """
     doc = fitz.open(pdf_path)
     figures = []
@@ -221,55 +396,71 @@ def fig_screenshot(pdf_path=PDF_PATH):
     
     try:
         for page_num, page in enumerate(doc):
-            text = page.get_text()
-            figure_matches = re.finditer(r'(?:Fig\.?|Figure)\s*(\d+):?\s*(.*?)(?=\n\n|\n[A-Z]|\Z)', 
-                                       text, re.DOTALL | re.IGNORECASE)
-            
-            for match in figure_matches:
-                fig_num = match.group(1)
-                fig_caption = match.group(2).strip()
-                
-                # 创建唯一标识符（页码+图表编号）
-                figure_id = f"{page_num + 1}_{fig_num}"
-                
-                # 避免重复处理同一个figure
-                if figure_id in processed_figures:
-                    continue
-                
-                caption_rect = _find_caption_position(page, fig_num)
-                
-                if caption_rect and _has_image_above(page, caption_rect):
-                    try:
-                        figure_rect = _estimate_figure_area(page, caption_rect)
-                        
-                        # 验证figure区域的有效性
-                        if figure_rect.width < 50 or figure_rect.height < 50:
-                            continue
-                            
-                        screenshot_path = _screenshot_figure(page, figure_rect, page_num + 1, fig_num, figures_dir)
-                        
-                        figures.append({
-                            'page': page_num + 1,
-                            'figure_number': fig_num,
-                            'caption': f"Fig. {fig_num}: {fig_caption}",
-                            'screenshot_path': screenshot_path,
-                            'figure_rect': figure_rect
-                        })
-                        
-                        # 标记为已处理
-                        processed_figures.add(figure_id)
-                        
-                    except Exception as e:
-                        continue
-                    
+            figures.extend(screenshot_page_figures(PageLayout(page), page_num, figures_dir, processed_figures))
     finally:
         doc.close()
     
     return figures
 
-def _find_caption_position(page, fig_num):
+def screenshot_page_figures(layout, page_num, figures_dir, processed_figures):
+    """
+    截取单页中的Figure图表
+
+    Args:
+        layout: 该页的PageLayout
+        page_num: 页码（从0开始）
+        figures_dir: 保存目录
+        processed_figures: 已处理figure标识的集合
+
+    Returns:
+        list: 本页的figure信息字典列表
+    """
+    figures = []
+    text = layout.text
+    figure_matches = re.finditer(r'(?:Fig\.?|Figure)\s*(\d+):?\s*(.*?)(?=\n\n|\n[A-Z]|\Z)', 
+                               text, re.DOTALL | re.IGNORECASE)
+
+    for match in figure_matches:
+        fig_num = match.group(1)
+        fig_caption = match.group(2).strip()
+
+        # 创建唯一标识符（页码+图表编号）
+        figure_id = f"{page_num + 1}_{fig_num}"
+
+        # 避免重复处理同一个figure
+        if figure_id in processed_figures:
+            continue
+
+        caption_rect = _find_caption_position(layout, fig_num)
+
+        if caption_rect and _has_image_above(layout, caption_rect):
+            try:
+                figure_rect = _estimate_figure_area(layout, caption_rect)
+
+                # 验证figure区域的有效性
+                if figure_rect.width < 50 or figure_rect.height < 50:
+                    continue
+
+                screenshot_path = _screenshot_figure(layout.page, figure_rect, page_num + 1, fig_num, figures_dir)
+
+                figures.append({
+                    'page': page_num + 1,
+                    'figure_number': fig_num,
+                    'caption': f"Fig. {fig_num}: {fig_caption}",
+                    'screenshot_path': screenshot_path,
+                    'figure_rect': figure_rect
+                })
+
+                # 标记为已处理
+                processed_figures.add(figure_id)
+
+            except Exception as e:
+                continue
+
+    return figures
+
+def _find_caption_position(layout, fig_num):
     """查找figure/table/scheme标题位置，支持各种格式"""
-    blocks = page.get_text("dict")["blocks"]
     # 支持所有大小写组合和不同类型  
     patterns = [
         # Figure patterns
@@ -289,30 +480,21 @@ def _find_caption_position(page, fig_num):
         f"scheme {fig_num}", f"Scheme {fig_num}", f"SCHEME {fig_num}"
     ]
     
-    for block in blocks:
-        if "lines" not in block:
-            continue
-        
-        # 提取文本
-        block_text = " ".join(" ".join(span["text"] for span in line["spans"]) 
-                             for line in block["lines"])
-        
+    for block_text, block_rect in zip(layout.block_texts, layout.text_rects):
         # 不区分大小写匹配
         if any(pattern.lower() in block_text.lower() for pattern in patterns):
-            return fitz.Rect(block["bbox"])
+            return fitz.Rect(block_rect)
     
     return None
 
-def _has_image_above(page, caption_rect, tolerance=15):
+def _has_image_above(layout, caption_rect, tolerance=15):
     """检查标题上方是否有图片，通过图片对象和文字密度验证"""
-    blocks = page.get_text("dict")["blocks"]
-    text_blocks = [fitz.Rect(block["bbox"]) for block in blocks if "lines" in block]
-    text_blocks.sort(key=lambda rect: rect.y0)
+    index = layout.text_index
+    widths = index.x1 - index.x0
     
     # 找到标题上方相邻区域
-    direct_above_bottom = max([0] + [rect.y1 for rect in text_blocks 
-                                     if (rect.y1 < caption_rect.y0
-                                     and rect.width >= caption_rect.width * 0.5)])
+    above = index.y1[(index.y1 < caption_rect.y0) & (widths >= caption_rect.width * 0.5)]
+    direct_above_bottom = max(0, float(above.max())) if above.size else 0
     
     # 定义搜索区域（增大搜素范围）
     search_rect = fitz.Rect(
@@ -321,53 +503,26 @@ def _has_image_above(page, caption_rect, tolerance=15):
     )
     
     # 检查是否有实际图片对象
-    has_actual_image = False
-    for img in page.get_images(full=True):
-        for img_rect in page.get_image_rects(img[0]):
-            if _rects_overlap(img_rect, search_rect):
-                has_actual_image = True
-                break
-        if has_actual_image:
-            break
+    has_actual_image = layout.image_index.any_overlap(search_rect)
     
     # 如果有实际图片对象，直接返回True
     if has_actual_image:
         return True
     
-    # 统计文本块并找最近大段落（一次遍历完成Rect构造和is_sec判断）
-    blocks = page.get_text("dict")["blocks"]
+    # 找到search_rect上方最近的大段落文字块（按y0排序后的最后一个）
     caption_width = caption_rect.width
-    text_blocks = []
-    for block in blocks:
-        if "lines" in block:
-            rect = fitz.Rect(block["bbox"])
-            is_sec = (rect.width >= caption_width * 0.9) and \
-                ((abs(rect.x0-caption_rect.x0) <= 50) or (abs(rect.x1-caption_rect.x1) <= 50))
-            text_blocks.append({'rect': rect, 'is_sec': is_sec, 'block': block})
-    text_blocks.sort(key=lambda b: b['rect'].y0)
-
-    # 找到search_rect上方最近的大段落文字块
+    is_sec = (widths >= caption_width * 0.9) & \
+        ((np.abs(index.x0 - caption_rect.x0) <= 50) | (np.abs(index.x1 - caption_rect.x1) <= 50))
+    candidates = np.flatnonzero(is_sec & (index.y1 < search_rect.y0))
     sec_y1 = 0
-    for b in reversed(text_blocks):
-        if b['is_sec'] and b['rect'].y1 < search_rect.y0:
-            sec_y1 = b['rect'].y1
-            break
-
-    # 只统计sec_y1和search_rect.y0之间的所有文字块面积（避免重复Rect构造）
-    text_area = 0
-    for b in text_blocks:
-        rect = b['rect']
-        if rect.y1 > sec_y1 and rect.y0 < search_rect.y0:
-            # 先做包围盒快速判断
-            if rect.x1 <= search_rect.x0 or rect.x0 >= search_rect.x1 or rect.y1 <= search_rect.y0 or rect.y0 >= search_rect.y1:
-                continue
-            # 只在有重叠时才计算面积
-            overlap_x0 = max(rect.x0, search_rect.x0)
-            overlap_y0 = max(rect.y0, search_rect.y0)
-            overlap_x1 = min(rect.x1, search_rect.x1)
-            overlap_y1 = min(rect.y1, search_rect.y1)
-            if overlap_x1 > overlap_x0 and overlap_y1 > overlap_y0:
-                text_area += (overlap_x1 - overlap_x0) * (overlap_y1 - overlap_y0)
+    if candidates.size:
+        nearest = candidates[np.lexsort((candidates, index.y0[candidates]))[-1]]
+        sec_y1 = float(index.y1[nearest])
+
+    # 只统计sec_y1和search_rect.y0之间、与search_rect重叠的文字块面积
+    ids, overlap_areas = index.overlap_areas(search_rect)
+    in_range = (index.y1[ids] > sec_y1) & (index.y0[ids] < search_rect.y0)
+    text_area = float(overlap_areas[in_range].sum())
     
     total_area = search_rect.width * search_rect.height
     
@@ -384,38 +539,21 @@ def _has_image_above(page, caption_rect, tolerance=15):
     
     return False
 
-def _rects_overlap(rect1, rect2):
-    """检查两个矩形是否重叠"""
-    return not (rect1.x1 <= rect2.x0 or rect2.x1 <= rect1.x0 or 
-                rect1.y1 <= rect2.y0 or rect2.y1 <= rect1.y0)
-
-def _get_overlap_rect(rect1, rect2):
-    """获取两个矩形的重叠区域"""
-    if not _rects_overlap(rect1, rect2):
-        return None
-    return fitz.Rect(max(rect1.x0, rect2.x0), max(rect1.y0, rect2.y0),
-                     min(rect1.x1, rect2.x1), min(rect1.y1, rect2.y1))
-
-def _estimate_figure_area(page, caption_rect):
+def _estimate_figure_area(layout, caption_rect):
     """估算figure显示区域，基于相关图片和文本块分析"""
-    page_rect = page.rect
+    page_rect = layout.rect
     
     # 扩大搜索区域，确保能找到所有相关图片
-   
-    blocks = page.get_text("dict")["blocks"]
-    text_blocks = [fitz.Rect(block["bbox"]) for block in blocks if "lines" in block]
-    text_blocks.sort(key=lambda rect: rect.y0)
+    index = layout.text_index
 
     # 筛选搜索区域：宽度小于caption_rect的块不包括在内
     caption_width = caption_rect.width
-    filtered_text_blocks = [rect for rect in text_blocks 
-                           if rect.width >= caption_width * 0.9
-                           and (abs(rect.x0-caption_rect.x0) <= 40
-                            or abs(rect.x1-caption_rect.x1) <= 40)]  # 至少是标题宽度的50%
+    filtered = ((index.x1 - index.x0) >= caption_width * 0.9) & \
+        ((np.abs(index.x0 - caption_rect.x0) <= 40) | (np.abs(index.x1 - caption_rect.x1) <= 40))
 
     # 然后计算搜索区域
-    direct_above_bottom = max([5] + [rect.y1 for rect in filtered_text_blocks 
-                                 if rect.y1 < caption_rect.y0])
+    above = index.y1[filtered & (index.y1 < caption_rect.y0)]
+    direct_above_bottom = max(5, float(above.max())) if above.size else 5
     
     search_area = fitz.Rect(
         max(0, caption_rect.x0), 
@@ -424,11 +562,7 @@ def _estimate_figure_area(page, caption_rect):
         caption_rect.y0
     )
     
-    related_rects = []
-    for img in page.get_images(full=True):
-        for img_rect in page.get_image_rects(img[0]):
-            if _rects_overlap(img_rect, search_area):
-                related_rects.append(img_rect)
+    related_rects = [layout.all_image_rects[i] for i in layout.image_index.overlapping(search_area)]
     
     # 确定边界
     if related_rects:
@@ -454,27 +588,17 @@ def _estimate_figure_area(page, caption_rect):
             
     else:
         # 分析文本块
-        blocks = page.get_text("dict")["blocks"]
         text_blocks = []
-        for block in blocks:
-            if "lines" in block:
-                rect = fitz.Rect(block["bbox"])
-                # 判断是否为新的段落文字
-                block_height = rect.y1 - rect.y0
-                # 统计词数
-                word_count = 0
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        word_count += len(span["text"].split())
-                is_sec = (
-                    (rect.width >= caption_width * 0.6)
-                    and ((abs(rect.x0-caption_rect.x0) <= 50) or (abs(rect.x1-caption_rect.x1) <= 50))
-                    and (block_height > 15)
-                    and (word_count > 1)
-                )
-            
-            
-                text_blocks.append({'rect': rect, 'is_sec': is_sec})
+        for rect, word_count in zip(layout.text_rects, layout.block_word_counts):
+            # 判断是否为新的段落文字
+            block_height = rect.y1 - rect.y0
+            is_sec = (
+                (rect.width >= caption_width * 0.6)
+                and ((abs(rect.x0-caption_rect.x0) <= 50) or (abs(rect.x1-caption_rect.x1) <= 50))
+                and (block_height > 15)
+                and (word_count > 1)
+            )
+            text_blocks.append({'rect': rect, 'is_sec': is_sec})
         text_blocks.sort(key=lambda b: b['rect'].y0)
         # 选择所有正文text_blocks的最低点作为截图上边界
         candidate_y1 = [0] + [block['rect'].y1 for block in text_blocks if block['is_sec'] and block['rect'].y1 < caption_rect.y0]
@@ -487,8 +611,27 @@ def _estimate_figure_area(page, caption_rect):
     
     return fitz.Rect(left_boundary, top_boundary, right_boundary, caption_rect.y0)
 
+def _figure_zoom(rect, target_width=FIGURE_TARGET_WIDTH):
+    """根据目标输出宽度计算截图缩放倍数（像素上限由_render_clip保证）"""
+    zoom = target_width / rect.width if rect.width > 0 else FIGURE_MAX_ZOOM
+    return max(FIGURE_MIN_ZOOM, min(FIGURE_MAX_ZOOM, zoom))
+
+def _render_clip(page, clip, zoom, filepath):
+    """
+    按缩放倍数渲染页面区域并保存
+    输出像素超过FIGURE_MAX_PIXELS时降低缩放倍数（必要时低于FIGURE_MIN_ZOOM），一次渲染即可
+    """
+    width, height = clip.width, clip.height
+    # 取整到整像素后每边最多多出2像素，按 (宽·zoom+2)(高·zoom+2) 不超过上限求zoom
+    if (width * zoom + 2) * (height * zoom + 2) > FIGURE_MAX_PIXELS:
+        linear = 2 * (width + height)
+        zoom = (-linear + (linear ** 2 - 4 * width * height * (4 - FIGURE_MAX_PIXELS)) ** 0.5) / (2 * width * height)
+    pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    pixmap.save(filepath)
+    pixmap = None  # 释放内存
+
 def _screenshot_figure(page, figure_rect, page_num, fig_num, output_dir):
-    """高精度截图保存figure区域（8倍缩放）"""
+    """高精度截图保存figure区域（按目标尺寸自适应缩放）"""
     # 验证区域有效性
     page_rect = page.rect
     
@@ -504,25 +647,17 @@ def _screenshot_figure(page, figure_rect, page_num, fig_num, output_dir):
     figure_rect = figure_rect & page_rect
     
     try:
-        # 8x缩放高精度截图
-        matrix = fitz.Matrix(8.0, 8.0)
-        pixmap = page.get_pixmap(matrix=matrix, clip=figure_rect, alpha=False)
-        
-        # 保存
         filepath = os.path.join(output_dir, f"page_{page_num}_fig_{fig_num}.png")
-        pixmap.save(filepath)
-        pixmap = None  # 释放内存
-        
+        _render_clip(page, figure_rect, _figure_zoom(figure_rect), filepath)
         return filepath
     except Exception as e:
         # 尝试使用更保守的区域重新截图
         safe_rect = fitz.Rect(page_rect.width * 0.1, page_rect.height * 0.1,
                              page_rect.width * 0.9, page_rect.height * 0.9)
-        matrix = fitz.Matrix(4.0, 4.0)  # 降低缩放倍数
-        pixmap = page.get_pixmap(matrix=matrix, clip=safe_rect, alpha=False)
+        # 降低缩放倍数
+        zoom = _figure_zoom(safe_rect) / 2
         
         filepath = os.path.join(output_dir, f"page_{page_num}_fig_{fig_num}_safe.png")
-        pixmap.save(filepath)
-        pixmap = None
+        _render_clip(page, safe_rect, max(FIGURE_MIN_ZOOM, zoom), filepath)
         
-        return filepath
\ No newline at end of file
+        return filepath
@@ -0,0 +1,87 @@
+"""
+矩形空间索引模块
+
+功能：
+- RectIndex：单页内矩形（文本块/图片位置）的均匀网格索引
+- 查询与给定矩形重叠的矩形及重叠面积，候选筛选后使用numpy向量化计算
+"""
+
+import numpy as np
+
+GRID_CELLS = 16  # 每个方向的网格数
+GRID_MIN_RECTS = 32  # 矩形较少时直接向量化遍历全部，不建网格
+
+
+class RectIndex:
+    """矩形集合的空间索引，边界相接不算重叠"""
+
+    def __init__(self, rects, bounds):
+        """
+        Args:
+            rects: 矩形列表（fitz.Rect或(x0, y0, x1, y1)）
+            bounds: 网格覆盖范围（通常为页面矩形），范围外的矩形归入边缘网格
+        """
+        self.boxes = np.array([tuple(r)[:4] for r in rects], dtype=float).reshape(-1, 4)
+        self.x0, self.y0, self.x1, self.y1 = self.boxes.T
+        self._all = np.arange(len(self.boxes))
+        self._grid = None
+        if len(self.boxes) >= GRID_MIN_RECTS:
+            bx0, by0, bx1, by1 = tuple(bounds)[:4]
+            self._origin = (bx0, by0)
+            self._cell = (max(bx1 - bx0, 1e-6) / GRID_CELLS, max(by1 - by0, 1e-6) / GRID_CELLS)
+            buckets = {}
+            cx0, cy0, cx1, cy1 = self._cell_range(self.boxes)
+            for i in range(len(self.boxes)):
+                for cx in range(cx0[i], cx1[i] + 1):
+                    for cy in range(cy0[i], cy1[i] + 1):
+                        buckets.setdefault((cx, cy), []).append(i)
+            self._grid = {cell: np.array(ids) for cell, ids in buckets.items()}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cell_range(self, boxes):
+        """矩形覆盖的网格下标范围（裁剪到网格内）"""
+        ox, oy = self._origin
+        wx, wy = self._cell
+        clip = lambda v: np.clip(np.floor(v).astype(int), 0, GRID_CELLS - 1)
+        return (clip((boxes[:, 0] - ox) / wx), clip((boxes[:, 1] - oy) / wy),
+                clip((boxes[:, 2] - ox) / wx), clip((boxes[:, 3] - oy) / wy))
+
+    def _candidates(self, rect):
+        if self._grid is None:
+            return self._all
+        cx0, cy0, cx1, cy1 = (int(v[0]) for v in self._cell_range(np.array([tuple(rect)[:4]], dtype=float)))
+        found = [
+            self._grid[(cx, cy)]
+            for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+            if (cx, cy) in self._grid
+        ]
+        if not found:
+            return self._all[:0]
+        return np.unique(np.concatenate(found))
+
+    def overlapping(self, rect):
+        """
+        Returns:
+            np.ndarray: 与rect重叠的矩形下标（升序，即原始顺序）
+        """
+        ids = self._candidates(rect)
+        x0, y0, x1, y1 = tuple(rect)[:4]
+        hit = ~((self.x1[ids] <= x0) | (x1 <= self.x0[ids]) | (self.y1[ids] <= y0) | (y1 <= self.y0[ids]))
+        return ids[hit]
+
+    def overlap_areas(self, rect):
+        """
+        Returns:
+            tuple: (重叠矩形下标, 各自与rect的重叠面积)
+        """
+        ids = self.overlapping(rect)
+        x0, y0, x1, y1 = tuple(rect)[:4]
+        widths = np.minimum(self.x1[ids], x1) - np.maximum(self.x0[ids], x0)
+        heights = np.minimum(self.y1[ids], y1) - np.maximum(self.y0[ids], y0)
+        return ids, widths * heights
+
+    def any_overlap(self, rect):
+        """是否存在与rect重叠的矩形"""
+        return len(self.overlapping(rect)) > 0
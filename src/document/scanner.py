@@ -0,0 +1,161 @@
+"""
+PDF单遍扫描模块
+
+功能：
+- 只打开一次文档，逐页一次性完成文本、嵌入图片与Figure截图的提取
+- 以生成器逐页产出记录，处理流程可以边扫描边处理已完成的页面
+- 同一文档内按内容哈希去重，可选跨任务共享的图片资源库（AssetStore）
+- 多进程模式：按页码区间分给多个进程各自打开文档提取，按页序合并结果，
+  跨区间重复的图片按页序去重并重新编号，重复内容按内容哈希合并为同一文件，文件命名与单进程一致
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+from src.document.asset_store import link_file
+from src.document.picture_get import PageLayout, extract_page_images, screenshot_page_figures, content_path
+
+PDF_PATH = "src/document/article.pdf"
+
+# 多进程模式下每个进程分到的区间数，区间越多负载越均衡
+RANGES_PER_WORKER = 2
+
+
+def scan_document(pdf_path=PDF_PATH, workers=1, assets=None):
+    """
+    逐页扫描PDF，图片保存到PDF同目录下的picture/与figures/
+
+    Args:
+        pdf_path: PDF文件路径
+        workers: 提取进程数，大于1时使用多进程模式
+        assets: 可选的AssetStore，跨任务复用已提取的图片
+
+    Yields:
+        dict: 每页一条记录
+            page: 页码（从1开始）
+            page_count: 文档总页数
+            text: 页面文本
+            layout: 该页的PageLayout（仅在本次迭代内有效，文档随生成器结束而关闭；多进程模式下为None）
+            images: 本页保存的嵌入图片路径列表
+            figures: 本页的figure信息字典列表
+    """
+    picture_dir = os.path.join(os.path.dirname(pdf_path), "picture")
+    figures_dir = os.path.join(os.path.dirname(pdf_path), "figures")
+    os.makedirs(picture_dir, exist_ok=True)
+    os.makedirs(figures_dir, exist_ok=True)
+
+    if workers > 1:
+        yield from _scan_parallel(pdf_path, workers, picture_dir, figures_dir, assets)
+        return
+
+    doc = fitz.open(pdf_path)
+    # 跨页记录已处理的图片（xref与内容哈希）与figure，避免重复
+    processed_images = set()
+    content_cache = {}
+    processed_figures = set()
+
+    try:
+        for page_num, page in enumerate(doc):
+            layout = PageLayout(page)
+            yield {
+                "page": page_num + 1,
+                "page_count": doc.page_count,
+                "text": layout.text,
+                "layout": layout,
+                "images": extract_page_images(doc, layout, page_num, picture_dir, processed_images,
+                                              content_cache=content_cache, assets=assets),
+                "figures": screenshot_page_figures(layout, page_num, figures_dir, processed_figures),
+            }
+    finally:
+        doc.close()
+
+
+def _scan_range(pdf_path, start, stop, picture_dir, figures_dir, assets=None):
+    """
+    提取[start, stop)区间的页面（在子进程中执行）
+
+    Returns:
+        list: 每页记录，images为 (xref, 内容哈希, 路径) 列表，尚未跨区间去重
+    """
+    doc = fitz.open(pdf_path)
+    processed_images = set()
+    content_cache = {}
+    processed_figures = set()
+    records = []
+    try:
+        for page_num in range(start, stop):
+            layout = PageLayout(doc[page_num])
+            saved = []
+            paths = extract_page_images(doc, layout, page_num, picture_dir, processed_images, saved_xrefs=saved,
+                                        content_cache=content_cache, assets=assets)
+            records.append({
+                "page": page_num + 1,
+                "page_count": doc.page_count,
+                "text": layout.text,
+                "layout": None,
+                "images": [(xref, digest, path) for (xref, digest), path in zip(saved, paths)],
+                "figures": screenshot_page_figures(layout, page_num, figures_dir, processed_figures),
+            })
+    finally:
+        doc.close()
+    return records
+
+
+def _merge_page_images(record, picture_dir, seen_xrefs, seen_digests):
+    """
+    按页序合并一页的图片：删除在前面页面已提取过的图片，其余按 page_N_img_K 重新连续编号；
+    内容与前面的图片相同时（其他进程各自提取的重复内容）改为链接到同一内容副本
+
+    Returns:
+        list: 本页最终的图片路径列表
+    """
+    kept = []
+    for xref, digest, path in record["images"]:
+        if xref in seen_xrefs:
+            os.remove(path)
+            continue
+        seen_xrefs.add(xref)
+        if digest in seen_digests:
+            link_file(content_path(picture_dir, digest), path)
+        else:
+            seen_digests.add(digest)
+        kept.append(path)
+
+    # 编号只会变小，按顺序重命名时目标文件已被删除或已移走
+    images = []
+    for index, path in enumerate(kept, start=1):
+        target = os.path.join(picture_dir, f"page_{record['page']}_img_{index}.png")
+        if path != target:
+            os.replace(path, target)
+        images.append(target)
+    return images
+
+
+def _scan_parallel(pdf_path, workers, picture_dir, figures_dir, assets=None):
+    """多进程提取，按页序产出记录"""
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if page_count == 0:
+        return
+
+    range_size = max(1, math.ceil(page_count / (workers * RANGES_PER_WORKER)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+
+    # 使用spawn启动子进程，避免在多线程的服务进程中fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+        futures = [pool.submit(_scan_range, pdf_path, start, stop, picture_dir, figures_dir, assets) for start, stop in ranges]
+        seen_xrefs = set()
+        seen_digests = set()
+        try:
+            for future in futures:
+                for record in future.result():
+                    record["images"] = _merge_page_images(record, picture_dir, seen_xrefs, seen_digests)
+                    yield record
+        finally:
+            for future in futures:
+                future.cancel()
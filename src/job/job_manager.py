@@ -0,0 +1,219 @@
+"""
+PDF处理任务管理模块
+
+功能：
+- 为每次上传分配独立的任务ID与工作目录，多用户同时处理互不干扰
+- 有界任务队列 + 可配置的并发任务数
+- 按任务ID查询处理状态，或阻塞等待任务的下一次变化（推送式进度）
+- 自动清理较早完成的任务目录
+"""
+
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from src.document.page_store import PageManifest, page_cache
+
+# 任务工作目录下需要预先创建的子目录
+JOB_SUBDIRS = ["html/original", "html/translated", "html/final", "picture", "figures"]
+
+FINISHED_STATES = ("completed", "error")
+
+# 任务变化的类别：状态信息、页面内容、分析/推荐结果
+CHANGE_KINDS = ("status", "pages", "results")
+
+
+class Job:
+    """单个PDF处理任务：工作目录、处理状态与任务私有的运行时数据"""
+
+    def __init__(self, job_id, work_dir):
+        self.id = job_id
+        self.dir = Path(work_dir)
+        self.pdf_path = self.dir / "article.pdf"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = {"status": "queued", "message": "排队等待处理", "completed_pages": [], "progress": 0}
+        self.previews = {}  # 页码 -> 生成中的部分HTML（渐进式渲染）
+        self.manifest = PageManifest(self.dir)  # 已生成页面的清单
+        self.context = None  # html转换的风格上下文，由处理流程创建
+        self.lock = threading.Lock()
+        # 每次变化版本号加一，marks记录各类别最近一次变化时的版本号
+        self.version = 0
+        self.marks = {kind: 0 for kind in CHANGE_KINDS}
+        self._changed = threading.Condition(self.lock)
+
+    def _touch(self, *kinds):
+        """记录一次变化并唤醒等待者（调用方持有锁）"""
+        self.version += 1
+        for kind in kinds:
+            self.marks[kind] = self.version
+        self._changed.notify_all()
+
+    def notify(self, kind):
+        """通知订阅者任务发生了指定类别的变化"""
+        with self.lock:
+            self._touch(kind)
+
+    def update_status(self, fields):
+        """线程安全地更新处理状态"""
+        with self.lock:
+            kinds = ["status"]
+            if "completed_pages" in fields:
+                if list(fields["completed_pages"]) != self.status["completed_pages"]:
+                    kinds.append("pages")
+                self.status["completed_pages"] = list(fields["completed_pages"])
+            self.status.update({k: v for k, v in fields.items() if k != "completed_pages"})
+            if self.status["status"] in FINISHED_STATES and self.finished_at is None:
+                self.finished_at = time.time()
+                # 结束时界面需要完整刷新一次
+                kinds = list(CHANGE_KINDS)
+            self._touch(*kinds)
+
+    def set_preview(self, page_num, partial_html):
+        """更新页面的生成中预览"""
+        with self.lock:
+            self.previews[page_num] = partial_html
+            self._touch("pages")
+
+    def pop_preview(self, page_num):
+        """移除页面预览（页面已生成完整文件）"""
+        with self.lock:
+            if self.previews.pop(page_num, None) is not None:
+                self._touch("pages")
+
+    def wait_for_update(self, version, timeout=None):
+        """
+        阻塞直到任务版本号超过version、任务结束或超时
+
+        Returns:
+            tuple: (当前版本号, 自version之后发生变化的类别集合)
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.version != version or self.status["status"] in FINISHED_STATES,
+                timeout=timeout
+            )
+            changed = {kind for kind, mark in self.marks.items() if mark > version}
+            return self.version, changed
+
+    def get_status(self):
+        """获取处理状态的快照"""
+        with self.lock:
+            status = dict(self.status)
+            status["completed_pages"] = list(status["completed_pages"])
+            return status
+
+    @property
+    def finished(self):
+        with self.lock:
+            return self.status["status"] in FINISHED_STATES
+
+
+class JobManager:
+    """有界队列 + 固定数量工作线程的任务调度器"""
+
+    def __init__(self, runner, base_dir, max_concurrent_jobs=2, max_queued_jobs=8, max_finished_jobs=20):
+        """
+        Args:
+            runner: 处理函数，签名为 runner(job)，在工作线程中执行
+            base_dir: 所有任务工作目录的父目录
+            max_concurrent_jobs: 同时处理的任务数
+            max_queued_jobs: 排队等待的任务数上限，超出后拒绝新任务
+            max_finished_jobs: 保留的已完成任务数，超出后删除最早完成任务的目录
+        """
+        self.runner = runner
+        self.base_dir = Path(base_dir)
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, max_queued_jobs))
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(max(1, max_concurrent_jobs)):
+            worker = threading.Thread(target=self._worker, name=f"job-worker-{i + 1}", daemon=True)
+            worker.start()
+
+    def submit(self, source_pdf):
+        """
+        创建任务并加入队列
+
+        Args:
+            source_pdf: 上传的PDF文件路径，会被复制到任务工作目录
+
+        Returns:
+            Job: 新建的任务
+
+        Raises:
+            RuntimeError: 排队任务已满
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(job_id, self.base_dir / job_id)
+        for subdir in JOB_SUBDIRS:
+            (job.dir / subdir).mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source_pdf, str(job.pdf_path))
+
+        with self._lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._remove(job_id)
+            raise RuntimeError("当前排队任务过多，请稍后再试")
+
+        self._cleanup_finished()
+        return job
+
+    def get(self, job_id):
+        """按ID获取任务，不存在时返回None"""
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id):
+        """按ID查询处理状态，不存在时返回None"""
+        job = self.get(job_id)
+        return job.get_status() if job is not None else None
+
+    def queue_position(self, job_id):
+        """任务在等待队列中的位置（从1开始），不在队列中返回0"""
+        with self._queue.mutex:
+            for position, job in enumerate(self._queue.queue, start=1):
+                if job.id == job_id:
+                    return position
+        return 0
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.update_status({"status": "processing", "message": "开始处理"})
+                self.runner(job)
+            except Exception as e:
+                job.update_status({"status": "error", "message": f"PDF处理失败: {str(e)}"})
+            finally:
+                # 处理函数未给出最终状态时视为异常结束
+                if not job.finished:
+                    job.update_status({"status": "error", "message": "处理意外中止"})
+                self._queue.task_done()
+
+    def _cleanup_finished(self):
+        """仅保留最近完成的max_finished_jobs个任务"""
+        with self._lock:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.finished),
+                key=lambda job: job.finished_at,
+            )
+            expired = finished[:max(0, len(finished) - self.max_finished_jobs)]
+        for job in expired:
+            self._remove(job.id)
+
+    def _remove(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and os.path.isdir(job.dir):
+            shutil.rmtree(job.dir, ignore_errors=True)
+            page_cache.discard_prefix(str(job.dir))
@@ -0,0 +1,52 @@
+"""
+静态资源缓存头模块
+
+功能：
+- AssetCacheMiddleware：ASGI中间件，为任务资源目录下的图片等静态文件响应添加长期缓存头
+  任务ID唯一且资源文件生成后不再修改，浏览器可放心长期缓存
+"""
+
+import os
+from urllib.parse import unquote
+
+DEFAULT_MAX_AGE = 365 * 24 * 3600  # 默认缓存一年
+
+
+class AssetCacheMiddleware:
+    """对 url_prefix + 资源目录内文件 的成功响应设置 Cache-Control"""
+
+    def __init__(self, app, asset_dir, url_prefix="/file=", max_age=DEFAULT_MAX_AGE):
+        """
+        Args:
+            app: 下游ASGI应用
+            asset_dir: 资源根目录（如 temp/jobs），只有其中的文件会添加缓存头
+            url_prefix: 文件路由前缀
+            max_age: 缓存时长（秒）
+        """
+        self.app = app
+        self.asset_dir = os.path.abspath(asset_dir)
+        self.url_prefix = url_prefix
+        self.cache_control = f"public, max-age={int(max_age)}, immutable".encode("latin-1")
+
+    def _is_asset(self, path):
+        if not path.startswith(self.url_prefix):
+            return False
+        file_path = os.path.abspath(unquote(path[len(self.url_prefix):]))
+        return file_path.startswith(self.asset_dir + os.sep)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_asset(scope.get("path", "")):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache(message):
+            if message["type"] == "http.response.start" and message["status"] in (200, 206):
+                headers = [
+                    (key, value) for key, value in message.get("headers", [])
+                    if key.lower() != b"cache-control"
+                ]
+                headers.append((b"cache-control", self.cache_control))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache)
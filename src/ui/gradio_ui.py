@@ -1,16 +1,36 @@
 import gradio as gr
+import asyncio
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+PROGRESS_WAIT_TIMEOUT = 30  # 等待任务变化的超时（秒），超时后检查任务是否仍在进行
+PROGRESS_WAIT_WORKERS = 256  # 同时订阅进度的会话数上限（独立线程池，不占用Gradio的工作线程）
     
 def create_reader_ui(
     get_temp_dir,
-    load_html,
+    list_pages,
+    get_page_html,
+    get_page_version,
     start_pdf_processing,
     check_processing_status,
-    api_chat
+    wait_for_job_update,
+    api_chat_stream
 ):
-    """创建AI Reader的Gradio界面"""
+    """
+    创建AI Reader的Gradio界面
+
+    每个浏览器会话通过job_id_state记录自己上传的任务，
+    get_temp_dir/list_pages/get_page_html/check_processing_status 均按任务ID取数据，
+    界面状态中只保存页面ID列表，页面html在显示时按需逐页获取，
+    get_page_version 给出页面内容来源的标识，推送进度时只在当前页内容变化时重新发送页面，
+    wait_for_job_update 阻塞等待任务变化，用于推送处理进度
+    """
     temp_path = get_temp_dir()
+    # 正在订阅任务变化的会话：会话ID -> (浏览的页码下标, 页面ID, 已推送的内容版本) / 任务ID
+    viewer_pages = {}
+    active_jobs = {}
+    progress_executor = ThreadPoolExecutor(max_workers=PROGRESS_WAIT_WORKERS, thread_name_prefix="progress-wait")
 
     def load_analyze_result(temp_dir):
         """加载论文分析结果"""
@@ -349,7 +369,8 @@ def create_reader_ui(
         gr.HTML("<h1>AI Reader</h1>")
         
         page_index = gr.State(0)
-        html_contents_state = gr.State([])
+        page_ids_state = gr.State([])
+        job_id_state = gr.State(None)
         processed_page_num = gr.State(0)
         
         # 初始化分析和推荐状态
@@ -357,9 +378,6 @@ def create_reader_ui(
         initial_recommend = load_recommend_result(temp_path)
         analyze_result_state = gr.State(initial_analyze)
         recommend_result_state = gr.State(initial_recommend)
-        
-        initial_contents = load_html(temp_path)
-        html_contents_state.value = initial_contents
 
         with gr.Column():
             with gr.Row():
@@ -401,15 +419,13 @@ def create_reader_ui(
         with gr.Row(elem_classes=["main-container"]):
             with gr.Column(scale=2):
                 html_display = gr.HTML(
-                    value=f"""
+                    value="""
                     <div class="document-viewer">
-                        {initial_contents[0] if initial_contents else '''
                         <div style="text-align: center; padding: 4rem 2rem;">
                             <div style="font-size: 4rem; margin-bottom: 1rem;">📄</div>
                             <h3 style="margin-bottom: 1rem;">准备就绪</h3>
                             <p>上传PDF文件开始阅读</p>
                         </div>
-                        '''}
                     </div>
                     """,
                     elem_classes=["document-viewer"]
@@ -423,11 +439,7 @@ def create_reader_ui(
                     )
                     
                     page_info = gr.HTML(
-                        f"""
-                        <div style="text-align: center; padding: 10px; color: #007acc; font-weight: 600; font-size: 1.1rem;">
-                            第 1 页 / 共 {len(initial_contents)} 页
-                        </div>
-                        """ if initial_contents else """
+                        """
                         <div style="text-align: center; padding: 10px; color: rgba(0,0,0,0.5); font-weight: 600;">
                             第 - 页 / 共 0 页
                         </div>
@@ -463,51 +475,69 @@ def create_reader_ui(
                         elem_classes=["btn-modern"]
                     )
         
-        def handle_pdf_upload(file):
+        def handle_pdf_upload(file, request: gr.Request):
             """处理PDF上传"""
+            # 新任务从第一页开始浏览
+            viewer_pages.pop(request.session_hash, None)
             if file is None:
                 return {
                     upload_status: gr.update(value="错误：未选择任何文件"),
-                    html_contents_state: gr.update(),
+                    page_ids_state: gr.update(),
                     html_display: gr.update(),
                     page_index: gr.update(),
                     page_info: gr.update(),
                     analyze_display: gr.update(),
                     recommend_display: gr.update(),
                     analyze_result_state: gr.update(),
-                    recommend_result_state: gr.update()
+                    recommend_result_state: gr.update(),
+                    job_id_state: gr.update()
                 }
             
             try:
-                status_message = start_pdf_processing(file)
+                status_message, job_id = start_pdf_processing(file)
+                if job_id is None:
+                    return {
+                        upload_status: gr.update(value=status_message),
+                        page_ids_state: gr.update(),
+                        html_display: gr.update(),
+                        page_index: gr.update(),
+                        page_info: gr.update(),
+                        analyze_display: gr.update(),
+                        recommend_display: gr.update(),
+                        analyze_result_state: gr.update(),
+                        recommend_result_state: gr.update(),
+                        job_id_state: gr.update()
+                    }
                 
                 return {
-                    upload_status: gr.update(value="开始处理PDF，请稍候..."),
-                    html_contents_state: gr.update(),
+                    upload_status: gr.update(value=status_message),
+                    page_ids_state: [],  # 新任务的页面ID由进度推送填充
                     html_display: gr.update(),
                     page_index: gr.update(),
                     page_info: gr.update(),
                     analyze_display: gr.update(value="正在分析论文内容..."),
                     recommend_display: gr.update(value="正在生成相关推荐..."),
                     analyze_result_state: gr.update(),
-                    recommend_result_state: gr.update()
+                    recommend_result_state: gr.update(),
+                    job_id_state: job_id
                 }
             except Exception as e:
                 return {
                     upload_status: gr.update(value=f"处理启动失败: {str(e)}"),
-                    html_contents_state: gr.update(),
+                    page_ids_state: gr.update(),
                     html_display: gr.update(),
                     page_index: gr.update(),
                     page_info: gr.update(),
                     analyze_display: gr.update(),
                     recommend_display: gr.update(),
                     analyze_result_state: gr.update(),
-                    recommend_result_state: gr.update()
+                    recommend_result_state: gr.update(),
+                    job_id_state: gr.update()
                 }
         
-        def update_page_view(page_idx, all_htmls):
-            """更新页面显示"""
-            if not all_htmls:
+        def update_page_view(page_idx, page_ids, job_id):
+            """更新页面显示，只获取当前页的html"""
+            if not page_ids:
                 return """
                 <div class="document-viewer" style="width: 100%; max-width: 100%; position: relative;">
                     <div style="text-align: center; padding: 4rem 2rem;">
@@ -521,198 +551,214 @@ def create_reader_ui(
                 </div>
                 """
             
-            page_idx = max(0, min(page_idx, len(all_htmls) - 1))
-            html_content = f'''<div class="document-viewer" style="width: 100%; max-width: 100%; position: relative;">{all_htmls[page_idx]}</div>'''
+            page_idx = max(0, min(page_idx, len(page_ids) - 1))
+            page_html = get_page_html(job_id, page_ids[page_idx])
+            html_content = f'''<div class="document-viewer" style="width: 100%; max-width: 100%; position: relative;">{page_html}</div>'''
             
-            page_label_html = f"""
+            return html_content, page_idx, page_label(page_idx, len(page_ids))
+
+        def page_label(page_idx, total):
+            """页码标签html"""
+            return f"""
             <div style="text-align: center; padding: 10px; color: #007acc; font-weight: 600; font-size: 1.1rem;">
-                第 {page_idx + 1} 页 / 共 {len(all_htmls)} 页
+                第 {page_idx + 1} 页 / 共 {total} 页
             </div>
             """
-            
+
+        def remember_view(session_id, page_idx, page_ids, job_id, version):
+            """记录会话当前浏览的页面及已推送的内容版本（仅在订阅任务变化期间记录）"""
+            if session_id in active_jobs and page_ids:
+                viewer_pages[session_id] = (page_idx, page_ids[page_idx], version)
+
+        def show_page(page_idx, page_ids, job_id, request):
+            """显示指定页面并记录浏览位置"""
+            version = None
+            if page_ids:
+                page_idx = max(0, min(page_idx, len(page_ids) - 1))
+                # 先取版本再取内容：两者之间页面发生变化时，下一次推送会重新发送
+                version = get_page_version(job_id, page_ids[page_idx])
+            html_content, page_idx, page_label_html = update_page_view(page_idx, page_ids, job_id)
+            remember_view(request.session_hash, page_idx, page_ids, job_id, version)
             return html_content, page_idx, page_label_html
 
-        def check_processing_progress(current_page_idx):
-            """检查PDF处理进度"""
+        def collect_progress_updates(job_id, session_id, changed):
+            """
+            根据任务变化的类别整理需要推送的组件更新（在等待线程池中执行）
+
+            Returns:
+                tuple: (组件更新字典, 任务是否结束)
+            """
+            status_message, completed, progress, completed_pages = check_processing_status(job_id)
+            updates = {
+                upload_status: gr.update(
+                    value=status_message if completed else f"{status_message} (进度: {int(progress)}%)")
+            }
+
+            if "results" in changed:
+                job_dir = get_temp_dir(job_id)
+                current_analyze = load_analyze_result(job_dir)
+                current_recommend = load_recommend_result(job_dir)
+                updates.update({
+                    analyze_display: gr.update(value=current_analyze),
+                    recommend_display: gr.update(value=current_recommend),
+                    analyze_result_state: current_analyze,
+                    recommend_result_state: current_recommend
+                })
+
+            if "pages" in changed:
+                page_ids = list_pages(job_id)
+                if page_ids:
+                    # 保持用户当前浏览的页面；只有该页内容来源变化时才重新推送页面html
+                    viewed_idx, viewed_page, sent_version = viewer_pages.get(session_id, (0, None, None))
+                    page_idx = max(0, min(viewed_idx, len(page_ids) - 1))
+                    page_id = page_ids[page_idx]
+                    version = get_page_version(job_id, page_id)
+                    updates.update({
+                        page_ids_state: page_ids,
+                        page_index: page_idx,
+                        page_info: gr.update(value=page_label(page_idx, len(page_ids)))
+                    })
+                    if (page_id, version) != (viewed_page, sent_version):
+                        html_content, _, _ = update_page_view(page_idx, page_ids, job_id)
+                        updates[html_display] = gr.update(value=html_content)
+                    remember_view(session_id, page_idx, page_ids, job_id, version)
+                elif completed:
+                    updates[upload_status] = gr.update(value="处理完成但未找到内容")
+
+            return updates, completed
+
+        async def stream_processing_progress(job_id, request: gr.Request):
+            """
+            订阅当前会话任务的变化并推送到界面：
+            仅在状态、页面或分析/推荐结果发生变化时更新对应组件，任务结束后停止。
+            等待在独立的线程池中进行，不占用Gradio处理其他事件的工作线程
+            """
+            if not job_id:
+                return
+            session_id = request.session_hash
+            active_jobs[session_id] = job_id
+            loop = asyncio.get_running_loop()
+            version = 0
             try:
-                status_message, completed, progress, completed_pages = check_processing_status()
-                
-                # 获取最新的分析和推荐结果
-                current_analyze = load_analyze_result(temp_path)
-                current_recommend = load_recommend_result(temp_path)
-                
-                # 如果处于空闲状态，不进行任何更新
-                if status_message == "请上传PDF并点击处理":
-                    return {
-                        upload_status: gr.update(),
-                        html_contents_state: gr.update(),
-                        html_display: gr.update(),
-                        page_index: gr.update(),
-                        page_info: gr.update(),
-                        analyze_display: gr.update(),
-                        recommend_display: gr.update(),
-                        analyze_result_state: gr.update(),
-                        recommend_result_state: gr.update(),
-                        timer: gr.update()
-                    }
-                
-                if completed:
-                    new_contents = load_html(temp_path)
-                    if new_contents:
-                        # 保持当前页面或调整到有效范围
-                        page_idx = max(0, min(current_page_idx, len(new_contents) - 1))
-                        page_html = new_contents[page_idx] if new_contents else "<p>无内容</p>"
-                        page_info_html = f"""
-                        <div style="text-align: center; padding: 10px; color: #007acc; font-weight: 600; font-size: 1.1rem;">
-                            第 {page_idx + 1} 页 / 共 {len(new_contents)} 页
-                        </div>
-                        """
-                        
-                        return {
-                            upload_status: gr.update(value=status_message),
-                            html_contents_state: new_contents,
-                            html_display: gr.update(value=f'<div class="document-viewer" style="width: 100%; max-width: 100%; position: relative;">{page_html}</div>'),
-                            page_index: page_idx,
-                            page_info: gr.update(value=page_info_html),
-                            analyze_display: gr.update(value=current_analyze),
-                            recommend_display: gr.update(value=current_recommend),
-                            analyze_result_state: current_analyze,
-                            recommend_result_state: current_recommend,
-                            timer: gr.update(active=False)
-                        }
-                    else:
-                        return {
-                            upload_status: gr.update(value="处理完成但未找到内容"),
-                            analyze_display: gr.update(value=current_analyze),
-                            recommend_display: gr.update(value=current_recommend),
-                            analyze_result_state: current_analyze,
-                            recommend_result_state: current_recommend,
-                            timer: gr.update(active=False)
-                        }
-                else:
-                    new_contents = load_html(temp_path)
-                    if new_contents and len(new_contents) > 0:
-                        # 保持当前页面或调整到有效范围
-                        page_idx = max(0, min(current_page_idx, len(new_contents) - 1))
-                        current_page_html = new_contents[page_idx]
-                        page_info_html = f"""
-                        <div style="text-align: center; padding: 10px; color: #007acc; font-weight: 600; font-size: 1.1rem;">
-                            第 {page_idx + 1} 页 / 共 {len(new_contents)} 页
-                        </div>
-                        """
-                        
-                        return {
-                            upload_status: gr.update(value=f"{status_message} (进度: {int(progress)}%)"),
-                            html_contents_state: new_contents,
-                            html_display: gr.update(value=f'<div class="document-viewer" style="width: 100%; max-width: 100%; position: relative;">{current_page_html}</div>'),
-                            page_index: page_idx,
-                            page_info: gr.update(value=page_info_html),
-                            analyze_display: gr.update(value=current_analyze),
-                            recommend_display: gr.update(value=current_recommend),
-                            analyze_result_state: current_analyze,
-                            recommend_result_state: current_recommend,
-                            timer: gr.update()
-                        }
-                    else:
-                        return {
-                            upload_status: gr.update(value=f"{status_message} (进度: {int(progress)}%)"),
-                            analyze_display: gr.update(value=current_analyze),
-                            recommend_display: gr.update(value=current_recommend),
-                            analyze_result_state: current_analyze,
-                            recommend_result_state: current_recommend,
-                            timer: gr.update()
-                        }
-            except Exception as e:
-                return {
-                    upload_status: gr.update(value=f"状态检查失败: {str(e)}"),
-                    timer: gr.update(active=False)
-                }
+                while True:
+                    # 同一会话重新上传后，旧任务的推送自动停止
+                    if active_jobs.get(session_id) != job_id:
+                        return
+                    version, changed = await loop.run_in_executor(
+                        progress_executor, wait_for_job_update, job_id, version, PROGRESS_WAIT_TIMEOUT)
+                    if version is None:
+                        return
+                    if not changed:
+                        # 等待超时或任务已结束且无新变化
+                        _, completed, _, _ = await loop.run_in_executor(
+                            progress_executor, check_processing_status, job_id)
+                        if completed:
+                            return
+                        continue
+
+                    try:
+                        updates, completed = await loop.run_in_executor(
+                            progress_executor, collect_progress_updates, job_id, session_id, changed)
+                    except Exception as e:
+                        yield {upload_status: gr.update(value=f"状态检查失败: {str(e)}")}
+                        return
+                    yield updates
+
+                    if completed:
+                        return
+            finally:
+                # 订阅结束后清除该会话的记录（重新上传后由新的订阅接管）
+                if active_jobs.get(session_id) == job_id:
+                    active_jobs.pop(session_id, None)
+                    viewer_pages.pop(session_id, None)
         
-        def prev_page(current_idx, all_htmls):
+        def prev_page(current_idx, page_ids, job_id, request: gr.Request):
             """快速切换到上一页"""
-            return update_page_view(current_idx - 1, all_htmls)
+            return show_page(current_idx - 1, page_ids, job_id, request)
         
-        def next_page(current_idx, all_htmls):
+        def next_page(current_idx, page_ids, job_id, request: gr.Request):
             """快速切换到下一页"""
-            return update_page_view(current_idx + 1, all_htmls)
+            return show_page(current_idx + 1, page_ids, job_id, request)
         
-        def chat_with_ai(message, history, current_page_idx, all_htmls):
-            """处理AI聊天"""
+        def chat_with_ai(message, history, current_page_idx, page_ids, job_id, request: gr.Request):
+            """处理AI聊天，流式显示回复"""
             if not message.strip():
-                return history, ""
+                yield history, ""
+                return
             
+            history.append([message, ""])
+            yield history, ""
             try:
                 current_page_text = ""
-                if all_htmls and current_page_idx < len(all_htmls):
-                    current_page_html = all_htmls[current_page_idx]
+                if page_ids and current_page_idx < len(page_ids):
+                    current_page_html = get_page_html(job_id, page_ids[current_page_idx])
                     current_page_text = re.sub(r'<[^>]+>', '', current_page_html)
                     current_page_text = re.sub(r'\s+', ' ', current_page_text).strip()
                 
-                ai_response = api_chat(message, current_page_text)
-                
-                history.append([message, ai_response])
-                return history, ""
+                for delta in api_chat_stream(message, current_page_text, session_id=request.session_hash):
+                    history[-1][1] += delta
+                    yield history, ""
                 
             except Exception as e:
                 error_msg = f"AI服务暂时不可用: {str(e)}"
-                history.append([message, error_msg])
-                return history, ""
+                history[-1][1] = error_msg
+                yield history, ""
         
         upload_btn.click(
             handle_pdf_upload,
             inputs=[pdf_upload],
             outputs=[
                 upload_status,
-                html_contents_state,
+                page_ids_state,
                 html_display,
                 page_index,
                 page_info,
                 analyze_display,
                 recommend_display,
                 analyze_result_state,
-                recommend_result_state
+                recommend_result_state,
+                job_id_state
             ]
-        )
-        
-        timer = gr.Timer(10)
-        timer.tick(
-            check_processing_progress,
-            inputs=[page_index],
+        ).then(
+            # 任务变化时推送进度，每个会话各自订阅，不受默认并发数限制
+            stream_processing_progress,
+            inputs=[job_id_state],
             outputs=[
                 upload_status,
-                html_contents_state,
+                page_ids_state,
                 html_display,
                 page_index,
                 page_info,
                 analyze_display,
                 recommend_display,
                 analyze_result_state,
-                recommend_result_state,
-                timer
-            ]
+                recommend_result_state
+            ],
+            concurrency_limit=None,
+            show_progress="hidden"
         )
         
         prev_btn.click(
             prev_page, 
-            inputs=[page_index, html_contents_state], 
+            inputs=[page_index, page_ids_state, job_id_state],
             outputs=[html_display, page_index, page_info]
         )
 
         next_btn.click(
             next_page, 
-            inputs=[page_index, html_contents_state], 
+            inputs=[page_index, page_ids_state, job_id_state],
             outputs=[html_display, page_index, page_info]
         )
         
         send_btn.click(
             chat_with_ai, 
-            inputs=[user_input, chat_history, page_index, html_contents_state], 
+            inputs=[user_input, chat_history, page_index, page_ids_state, job_id_state], 
             outputs=[chat_history, user_input],
             show_progress=False
         )
         user_input.submit(
             chat_with_ai, 
-            inputs=[user_input, chat_history, page_index, html_contents_state], 
+            inputs=[user_input, chat_history, page_index, page_ids_state, job_id_state], 
             outputs=[chat_history, user_input],
             show_progress=False
         )